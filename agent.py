@@ -1,19 +1,68 @@
+import math
 import random
-import copy
 import pickle
+import time
 import numpy as np
 
+import checkpoint
 import durak2 as dk
+import endgame
+import instrument
+import search
 import util
 
 
+def loadWeights(name, agentName, rng=None):
+    """
+    Returns (w_atk, w_def) from the latest record of the checkpoint name.ckpt, else
+    from the legacy pickles name_attack.bin and name_defend.bin, initializing any
+    that are missing from rng (a NumPy Generator or RandomState, by default np.random).
+    """
+    rng = rng if rng is not None else np.random
+    try:
+        return checkpoint.loadWeights('%s.ckpt' % name)
+    except (IOError, KeyError):
+        pass
+
+    weights = []
+    for kind, description in (('attack', 'attack'), ('defend', 'defense')):
+        try:
+            with open('%s_%s.bin' % (name, kind), 'rb') as f:
+                weights.append(pickle.load(f))
+        except IOError:
+            print('%s: Initializing new %s weights' % (agentName, description))
+            weights.append(rng.normal(0, 1e-2, (util.NUM_FEATURES,)))
+    return weights
+
+
 class Agent(object):
+    def newGame(self, seed=None):
+        """
+        Called before each tournament game. Agents that make random choices reseed them
+        from seed, and agents that carry state between games drop it, so any game can
+        be replayed on its own.
+        """
+        pass
+
     def getAttackCard(self, cards, game):
         raise NotImplementedError('Abstract function requires overriding')
 
     def getDefendCard(self, cards, game):
         raise NotImplementedError('Abstract function requires overriding')
 
+    def getAttackCards(self, optionsList, games):
+        """
+        Returns getAttackCard for each game, given its options. Agents that can share
+        work between games, e.g. one NumPy pass over all of them, override this.
+        """
+        return [self.getAttackCard(cards, game) for cards, game in zip(optionsList, games)]
+
+    def getDefendCards(self, optionsList, games):
+        """
+        Returns getDefendCard for each game, given its options.
+        """
+        return [self.getDefendCard(cards, game) for cards, game in zip(optionsList, games)]
+
 
 class HumanAgent(Agent):
     def __init__(self, playerNum):
@@ -34,7 +83,7 @@ class HumanAgent(Agent):
             index = util.readIntegerInRange(0, len(cards),
                                             'Select a card to begin attack: ')
         else:
-            cards.remove(dk.Durak.END_ROUND)
+            cards = cards[:-1]
             print(('Your options: ', cards))
             index = util.readIntegerInRange(-1, len(cards) - 1,
                                             'Select a card to attack (-1 to stop): ')
@@ -56,15 +105,49 @@ class HumanAgent(Agent):
 
 
 class RandomAgent(Agent):
+    def __init__(self, rng=None):
+        self.rng = rng if rng is not None else random
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if state['rng'] is random:
+            state['rng'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.rng is None:
+            self.rng = random
+
+    def newGame(self, seed=None):
+        if seed is not None:
+            self.rng = random.Random(seed)
+
     def getAttackCard(self, cards, game):
-        return random.choice(cards)
+        return self.rng.choice(cards)
 
     def getDefendCard(self, cards, game):
-        return random.choice(cards)
+        return self.rng.choice(cards)
 
 
 class SimpleAgent(Agent):
     def policy(self, cards, trumpSuit):
+        """
+        Returns the lowest non-trump card, else the lowest trump, else END_ROUND. Equal
+        ranks are broken by suit, the order move generation lists them in, so the choice
+        only depends on the lowest rank of each suit and is looked up in a table.
+        """
+        mask = 0
+        for card in cards:
+            mask |= 1 << card.id
+        low = _LOWEST_RANK
+        return _SIMPLE_POLICY[trumpSuit][low[mask & 0x1ff] * 1000 + low[mask >> 9 & 0x1ff] * 100 +
+                                         low[mask >> 18 & 0x1ff] * 10 + low[mask >> 27 & 0x1ff]]
+
+    def sortPolicy(self, cards, trumpSuit):
+        """
+        The sorting implementation of policy, kept as the reference for the table in the tests.
+        """
         if cards[-1] == dk.Durak.END_ROUND:
             cards = cards[:-1]
         sortedCards = sorted(cards, key=lambda c: c.rank)
@@ -84,51 +167,120 @@ class SimpleAgent(Agent):
         return self.policy(cards, game.trumpCard.suit)
 
 
+# 9-bit suit mask -> index of its lowest rank, 9 for none
+_LOWEST_RANK = [(m & -m).bit_length() - 1 if m else 9 for m in range(1 << 9)]
+
+
+def _simplePolicyTable():
+    """
+    Returns table[trumpSuit][1000 * low0 + 100 * low1 + 10 * low2 + low3], the card
+    SimpleAgent.policy plays when the lowest rank index of suit s is lows (9 for none).
+    """
+    table = {}
+    for trumpSuit in dk.Card.SUITS:
+        choices = []
+        for key in range(10 ** 4):
+            lows = [key // 10 ** (3 - suit) % 10 for suit in dk.Card.SUITS]
+            nonTrumps = [(lows[suit], suit) for suit in dk.Card.SUITS
+                         if suit != trumpSuit and lows[suit] < 9]
+            if nonTrumps:
+                low, suit = min(nonTrumps)
+                choices.append(dk.Card.fromId(9 * suit + low))
+            elif lows[trumpSuit] < 9:
+                choices.append(dk.Card.fromId(9 * trumpSuit + lows[trumpSuit]))
+            else:
+                choices.append(dk.Durak.END_ROUND)
+        table[trumpSuit] = choices
+    return table
+
+
+_SIMPLE_POLICY = _simplePolicyTable()
+
+
 ### LEARNING AGENTS
 
 
 class ReflexAgent(Agent):
-    def __init__(self, playerNum):
+    def __init__(self, playerNum, rng=None):
         self.playerNum = playerNum
-        try:
-            with open('reflex_attack.bin', 'r') as f_atk:
-                self.w_atk = pickle.load(f_atk)
-        except IOError:
-            print('ReflexAgent: Initializing new attack weights')
-            self.w_atk = np.random.normal(0, 1e-2, (util.NUM_FEATURES,))
-
-        try:
-            with open('reflex_defend.bin', 'r') as f_def:
-                self.w_def = pickle.load(f_def)
-        except IOError:
-            print('ReflexAgent: Initializing new defense weights')
-            self.w_def = np.random.normal(0, 1e-2, (util.NUM_FEATURES,))
+        # scratch buffer for leaf features, consumed before the next extraction
+        self.features = np.empty(util.NUM_FEATURES)
+        self.values = util.ValueCache()
+        self.w_atk, self.w_def = loadWeights('reflex', 'ReflexAgent', rng)
 
     def setAttackWeights(self, atkWeights):
         self.w_atk = atkWeights
+        self.values.invalidate()
 
     def setDefendWeights(self, defWeights):
         self.w_def = defWeights
+        self.values.invalidate()
 
     def chooseAction(self, cards, game):
-        return max(cards, key=lambda c: self.getValue(c, game))
+        values = self.getValues(cards, game)
+        return cards[int(np.argmax(values))]
+
+    def getValues(self, cards, game):
+        """
+        Returns getValue for every card in cards in one pass. Playing a card only
+        removes it from the hand, so an attacker's candidates are scored on the hand
+        features minus each card; a defender is scored on hand and table together,
+        which no defence changes. Values are looked up in and added to self.values.
+        """
+        hand = game.hand[self.playerNum].mask
+        trumpSuit = game.trumpCard.suit
+        values = self.values
+        if self.playerNum != game.attacker:
+            key = values.key(hand | game.table.mask, trumpSuit, values.DEFEND)
+            value = values.get(key)
+            if value is None:
+                features = util.featuresFromMask(hand | game.table.mask, trumpSuit)
+                value = util.logisticValues(self.w_def[None], features[None])[0]
+                values.put(key, value)
+            return np.full(len(cards), value)
+
+        result = np.empty(len(cards))
+        keys = []
+        missing = []
+        for i, card in enumerate(cards):
+            if card == dk.Durak.END_ROUND:
+                key = values.key(hand, trumpSuit, values.DEFEND)
+            else:
+                # the hand removalFeatures scores, which toggles the card's bit
+                key = values.key(hand ^ 1 << card.id, trumpSuit, values.ATTACK)
+            keys.append(key)
+            value = values.get(key)
+            if value is None:
+                missing.append(i)
+            else:
+                result[i] = value
+        if missing:
+            features = util.removalFeatures(hand, trumpSuit, [cards[i].id for i in missing])
+            weights = np.array([self.w_def if cards[i] == dk.Durak.END_ROUND else self.w_atk
+                                for i in missing])
+            for i, value in zip(missing, util.logisticValues(weights, features)):
+                result[i] = value
+                values.put(keys[i], value)
+        return result
 
     def getValue(self, card, game):
-        gameClone = copy.deepcopy(game)
-        gameClone.playCard(self.playerNum, card)
-        state = gameClone.getState(self.playerNum)
-
-        if state['isAttacker']:
-            if card == dk.Durak.END_ROUND:
-                state['isAttacker'] = False
-                weights = self.w_def
+        record = game.playCardUndoable(self.playerNum, card)
+        try:
+            state = game.getState(self.playerNum)
+
+            if state.isAttacker:
+                if card == dk.Durak.END_ROUND:
+                    state = state._replace(isAttacker=False)
+                    weights = self.w_def
+                else:
+                    weights = self.w_atk
             else:
-                weights = self.w_atk
-        else:
-            weights = self.w_def
-            state['hand'].addCards(state['table'].getCards())
+                weights = self.w_def
+                state = state._replace(hand=state.hand | state.table)
 
-        features = util.extractFeatures(state)
+            features = util.extractFeatures(state, self.features)
+        finally:
+            game.undo(record)
         return util.logisticValue(weights, features)
 
     def getAttackCard(self, cards, game):
@@ -137,81 +289,277 @@ class ReflexAgent(Agent):
     def getDefendCard(self, cards, game):
         return self.chooseAction(cards, game)
 
+    def getAttackCards(self, optionsList, games):
+        """
+        Scores the options of all games in one NumPy pass, with the same arithmetic as
+        getValues, so every game gets the card getAttackCard would choose.
+        """
+        counts = [len(cards) for cards in optionsList]
+        cardIds = np.array([card.id for cards in optionsList for card in cards])
+        handMasks = np.repeat([game.hand[self.playerNum].mask for game in games], counts)
+        trumpSuits = np.repeat([game.trumpCard.suit for game in games], counts)
+        features = util.removalFeaturesMany(handMasks.astype(np.int64), trumpSuits, cardIds)
+        weights = np.where((cardIds == dk.Card.NUM_CARDS)[:, None], self.w_def, self.w_atk)
+        values = util.logisticValues(weights, features)
+        choices = []
+        start = 0
+        for cards, n in zip(optionsList, counts):
+            choices.append(cards[int(np.argmax(values[start:start + n]))])
+            start += n
+        return choices
+
+    def getDefendCards(self, optionsList, games):
+        # every defence of a game scores the same (see getValues), so argmax picks the first
+        return [cards[0] for cards in optionsList]
+
 
 class SimpleEnhancedAgent(SimpleAgent):
-    def __init__(self, playerNum):
+    """
+    Plays SimpleAgent's policy while cards remain in the deck. Once the deck is empty it
+    plays a winning move from the exact endgame solver when one exists, and otherwise
+    (lost positions, or ones too large for the solver's budget) searches with
+    iterative-deepening alpha-beta over a transposition table.
+    depth is the deepest iteration, counted in the agent's own moves, and timeLimit is an
+    optional per-move budget in seconds; when it runs out, the deepest completed
+    iteration's move is played. With workers > 1 the root moves of large enough searches
+    (depth at least parallelMinDepth, both hands together at least parallelMinCards
+    cards) are instead searched to full depth in parallel processes, ignoring timeLimit;
+    smaller ones finish serially before the tasks could be sent.
+    """
+    parallelMinDepth = 3
+    parallelMinCards = 14
+
+    def __init__(self, playerNum, depth=2, timeLimit=None, ttSize=1 << 16, exactEndgame=True,
+                 workers=1, rng=None):
         self.playerNum = playerNum
-        self.depth = 2
-        try:
-            with open('simple_enhanced_attack.bin', 'r') as f_atk:
-                self.w_atk = pickle.load(f_atk)
-        except IOError:
-            print('SimpleEnhancedAgent: Initializing new attack weights')
-            self.w_atk = np.random.normal(0, 1e-2, (util.NUM_FEATURES,))
-
-        try:
-            with open('simple_enhanced_defend.bin', 'r') as f_def:
-                self.w_def = pickle.load(f_def)
-        except IOError:
-            print('SimpleEnhancedAgent: Initializing new defense weights')
-            self.w_def = np.random.normal(0, 1e-2, (util.NUM_FEATURES,))
+        self.features = np.empty(util.NUM_FEATURES)
+        self.depth = depth
+        self.timeLimit = timeLimit
+        self.tt = search.TranspositionTable(ttSize)
+        self.solver = endgame.EndgameSolver() if exactEndgame else None
+        self.searchPool = search.SearchPool(workers) if workers > 1 else None
+        self.values = util.ValueCache()
+        self.nodes = 0
+        self.moves = 0
+        self.moveSeconds = 0.0
+        self.maxMoveTime = 0.0
+        self.deadline = None
+        self.w_atk, self.w_def = loadWeights('simple_enhanced', 'SimpleEnhancedAgent', rng)
+
+    def __getstate__(self):
+        # search workers start with empty caches rather than copies of this agent's,
+        # rebuilt on arrival so only their sizes are pickled
+        state = self.__dict__.copy()
+        state['tt'] = self.tt.size
+        state['solver'] = self.solver is not None
+        state['searchPool'] = None
+        state['moves'] = 0
+        state['moveSeconds'] = 0.0
+        state['maxMoveTime'] = 0.0
+        # parallel tasks search to full depth, whatever the last serial move's deadline
+        state['deadline'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.tt = search.TranspositionTable(state['tt'])
+        self.solver = endgame.EndgameSolver() if state['solver'] else None
+
+    def newGame(self, seed=None):
+        # cached search results would make a game depend on the games before it
+        self.tt.clear()
+        if self.solver is not None:
+            self.solver.memo.clear()
 
     def setAttackWeights(self, atkWeights):
         self.w_atk = atkWeights
+        self.tt.clear()
+        self.values.invalidate()
 
     def setDefendWeights(self, defWeights):
         self.w_def = defWeights
+        self.tt.clear()
+        self.values.invalidate()
+
+    def getSearchStats(self):
+        """
+        Returns counters accumulated over all searched moves, for tuning depth,
+        timeLimit and ttSize.
+        """
+        stats = {
+            'moves': self.moves,
+            'nodes': self.nodes,
+            'ttProbes': self.tt.probes,
+            'ttHits': self.tt.hits,
+            'ttHitRate': float(self.tt.hits) / self.tt.probes if self.tt.probes else 0.0,
+            'meanMoveTime': self.moveSeconds / self.moves if self.moves else 0.0,
+            'maxMoveTime': self.maxMoveTime,
+        }
+        if self.solver is not None:
+            solverStats = self.solver.getStats()
+            stats.update(('endgame' + key[0].upper() + key[1:], value)
+                         for key, value in solverStats.items())
+        return stats
+
+    def recordMove(self, seconds):
+        self.moves += 1
+        self.moveSeconds += seconds
+        self.maxMoveTime = max(self.maxMoveTime, seconds)
+
+    def endgameChoice(self, cards, game):
+        if self.solver is not None:
+            try:
+                card = self.solver.chooseCard(cards, game, self.playerNum)
+            except endgame.SolveBudgetExceeded:
+                card = None
+            if card is not None:
+                return card
+        return self.minimaxChoice(cards, game)
 
     def minimaxChoice(self, cards, game):
-        opponent = int(not self.playerNum)
-        a = float('-inf')
-        b = float('+inf')
-        return max(cards, key=lambda c:
-                   self.getValueRec(opponent, game, c, self.depth, a, b))
-
-    def getValueRec(self, agent, game, card, depth, alpha, beta):
-        otherAgent = int(not agent)
-        gameClone = copy.deepcopy(game)
-        gameClone.playCard(otherAgent, card)
-        if gameClone.roundOver():
-            gameClone.endRound()
-
-        if gameClone.gameOver() and gameClone.isWinner(self.playerNum):
+        if self.searchPool is not None and self.depth >= self.parallelMinDepth and \
+                len(game.hand[0]) + len(game.hand[1]) >= self.parallelMinCards:
+            return self.parallelMinimaxChoice(cards, game)
+        start = time.perf_counter()
+        startNodes = self.nodes
+        self.tt.newGeneration()
+        self.deadline = None if self.timeLimit is None else start + self.timeLimit
+
+        bestCard = cards[0]
+        for depth in range(self.depth + 1):
+            # previous iteration's best move is searched first
+            ordered = [bestCard] + [c for c in cards if c is not bestCard]
+            try:
+                bestCard = self.searchRoot(ordered, game, depth)
+            except search.SearchTimeout:
+                break
+            # the depth 0 iteration always completes so there is a move to play
+            if depth == 0 and self.timeLimit is not None:
+                self.deadline = start + self.timeLimit
+
+        self.recordMove(time.perf_counter() - start)
+        if instrument.ENABLED:
+            instrument.record('SimpleEnhancedAgent.minimaxChoice', start)
+            instrument.count('search.nodes', self.nodes - startNodes)
+        return bestCard
+
+    def parallelMinimaxChoice(self, cards, game):
+        """
+        Root-parallel search: each root move is searched with a full window in its own
+        task, and the first move with the highest value wins, as in a serial search
+        without root window narrowing.
+        """
+        start = time.perf_counter()
+        results = self.searchPool.map(_searchRootMove, [(self, game, card) for card in cards])
+        values = [value for value, _ in results]
+        nodes = sum(nodes for _, nodes in results)
+        self.nodes += nodes
+        self.recordMove(time.perf_counter() - start)
+        if instrument.ENABLED:
+            instrument.record('SimpleEnhancedAgent.parallelMinimaxChoice', start)
+            instrument.count('search.nodes', nodes)
+        return cards[values.index(max(values))]
+
+    def searchRoot(self, cards, game, depth):
+        alpha = float('-inf')
+        bestCard = None
+        for card in cards:
+            v = self.getChildValue(game, self.playerNum, card, depth, alpha, float('+inf'))
+            if v > alpha:
+                alpha = v
+                bestCard = card
+        return bestCard
+
+    def getChildValue(self, game, player, card, depth, alpha, beta):
+        playRecord = game.playCardUndoable(player, card)
+        roundRecord = None
+        try:
+            if game.roundOver():
+                roundRecord = game.endRoundUndoable()
+            return self.alphaBeta(game, player, depth, alpha, beta)
+        finally:
+            if roundRecord is not None:
+                game.undo(roundRecord)
+            game.undo(playRecord)
+
+    def alphaBeta(self, game, lastPlayer, depth, alpha, beta):
+        self.nodes += 1
+        if self.deadline is not None and self.nodes & 255 == 0 and \
+                time.perf_counter() > self.deadline:
+            raise search.SearchTimeout()
+
+        if game.gameOver() and game.isWinner(self.playerNum):
             return 1
-        elif gameClone.gameOver() and gameClone.isLoser(self.playerNum):
+        elif game.gameOver() and game.isLoser(self.playerNum):
             return 0
-        elif depth == 0:
-            state = gameClone.getState(agent)
-            features = util.extractFeatures(state)
-            if agent == gameClone.attacker:
-                weights = self.w_atk
-            else:
-                weights = self.w_def
-            return util.logisticValue(weights, features)
 
-        if otherAgent == self.playerNum:
+        player = game.getPlayerToMove()
+        if depth == 0:
+            isAttacker = player == game.attacker
+            trumpSuit = game.trumpCard.suit
+            hand = game.hand[player].mask
+            values = self.values
+            key = values.key(hand, trumpSuit, values.ATTACK if isAttacker else values.DEFEND)
+            value = values.get(key)
+            if value is None:
+                features = util.featuresFromMask(hand, trumpSuit, self.features)
+                value = util.logisticValue(self.w_atk if isAttacker else self.w_def, features)
+                values.put(key, value)
+            return value
+
+        # depth counts the agent's own moves
+        if lastPlayer == self.playerNum:
             depth -= 1
-        if agent == gameClone.attacker:
-            cards = gameClone.getAttackOptions(agent)
+
+        key = search.ZOBRIST.getKey(game)
+        entry = self.tt.probe(key)
+        bestId = None
+        if entry is not None:
+            entryDepth, value, flag, bestId = entry
+            if entryDepth >= depth:
+                if flag == search.EXACT or \
+                        (flag == search.LOWER and value >= beta) or \
+                        (flag == search.UPPER and value <= alpha):
+                    return value
+
+        if player == game.attacker:
+            cards = game.getAttackOptions(player)
         else:
-            cards = gameClone.getDefendOptions(agent)
+            cards = game.getDefendOptions(player)
+        if bestId is not None:
+            cards = [dk.Card.fromId(bestId)] + [c for c in cards if c.id != bestId]
 
-        if agent == self.playerNum:
+        alphaOrig, betaOrig = alpha, beta
+        bestCard = cards[0]
+        if player == self.playerNum:
             v = float('-inf')
             for card in cards:
-                v = max(v, self.getValueRec(otherAgent, gameClone, card, depth, alpha, beta))
+                childValue = self.getChildValue(game, player, card, depth, alpha, beta)
+                if childValue > v:
+                    v = childValue
+                    bestCard = card
                 if v >= beta:
-                    return v
+                    break
                 alpha = max(alpha, v)
-            return v
         else:
             v = float('+inf')
             for card in cards:
-                v = min(v, self.getValueRec(otherAgent, gameClone, card, depth, alpha, beta))
+                childValue = self.getChildValue(game, player, card, depth, alpha, beta)
+                if childValue < v:
+                    v = childValue
+                    bestCard = card
                 if v <= alpha:
-                    return v
+                    break
                 beta = min(beta, v)
-            return v
+
+        if v <= alphaOrig:
+            flag = search.UPPER
+        elif v >= betaOrig:
+            flag = search.LOWER
+        else:
+            flag = search.EXACT
+        self.tt.store(key, depth, v, flag, bestCard.id)
+        return v
 
     def getAttackCard(self, cards, game):
         if len(game.deck) > 0:
@@ -219,7 +567,7 @@ class SimpleEnhancedAgent(SimpleAgent):
         elif len(cards) == 1:
             return cards[0]
         else:
-            return self.minimaxChoice(cards, game)
+            return self.endgameChoice(cards, game)
 
     def getDefendCard(self, cards, game):
         if len(game.deck) > 0:
@@ -227,4 +575,212 @@ class SimpleEnhancedAgent(SimpleAgent):
         elif len(cards) == 1:
             return cards[0]
         else:
-            return self.minimaxChoice(cards, game)
\ No newline at end of file
+            return self.endgameChoice(cards, game)
+
+
+class ISMCTSNode(object):
+    __slots__ = ('card', 'player', 'children', 'visits', 'wins', 'available')
+
+    def __init__(self, card=None, player=None):
+        self.card = card
+        self.player = player  # the player who played card to reach this node
+        self.children = {}
+        self.visits = 0
+        self.wins = 0
+        self.available = 0
+
+
+class ISMCTSAgent(Agent):
+    """
+    Single-observer information-set MCTS. Each iteration samples a determinization of
+    the cards this player cannot see, consistent with the game's unseenCards and
+    knownHand tracking, then descends the shared tree with UCT over the moves that are
+    legal in that determinization and finishes with a random playout.
+    The search stops after `playouts` iterations or `timeLimit` seconds, whichever
+    comes first, and the subtree of the moves actually played is reused on the next
+    decision. With workers > 1, the playouts are split between independent trees in
+    parallel processes (root parallelization) and their root visit counts are summed;
+    trees are then not reused.
+    """
+    def __init__(self, playerNum, playouts=500, timeLimit=None, exploration=0.7, rng=None,
+                 workers=1):
+        self.playerNum = playerNum
+        self.playouts = playouts
+        self.timeLimit = timeLimit
+        self.exploration = exploration
+        self.rng = rng if rng is not None else random
+        self.searchPool = search.SearchPool(workers) if workers > 1 else None
+        self.root = None
+        self.rootHistory = None
+        self.rootMoves = 0
+
+    def __getstate__(self):
+        # the default rng is the random module, which cannot be pickled; the search tree
+        # is only useful to this process
+        state = self.__dict__.copy()
+        if state['rng'] is random:
+            state['rng'] = None
+        state['root'] = state['rootHistory'] = None
+        state['searchPool'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.rng is None:
+            self.rng = random
+
+    def newGame(self, seed=None):
+        if seed is not None:
+            self.rng = random.Random(seed)
+        self.root = self.rootHistory = None
+
+    def determinize(self, game):
+        """
+        Returns a clone of game with the opponent's unknown cards and the deck replaced
+        by a random deal that is consistent with what this player has seen.
+        """
+        opponent = int(not self.playerNum)
+        known = game.knownHand[opponent].mask
+        poolMask = game.unseenCards[self.playerNum].mask & ~known & ~game.hand[self.playerNum].mask
+        if len(game.deck) > 0:
+            # the trump card lies face up at the bottom of the deck
+            poolMask &= ~(1 << game.trumpCard.id)
+        pool = [dk.Card.fromId(i) for i in range(dk.Card.NUM_CARDS) if poolMask >> i & 1]
+        self.rng.shuffle(pool)
+
+        clone = game.clone()
+        nUnknown = len(game.hand[opponent]) - len(game.knownHand[opponent])
+        clone.hand[opponent].mask = known
+        clone.hand[opponent].addCards(pool[:nUnknown])
+        clone.deck = pool[nUnknown:]
+        if len(game.deck) > 0:
+            clone.deck.append(game.trumpCard)
+        return clone
+
+    def applyMove(self, game, player, card):
+        game.playCard(player, card)
+        if game.roundOver() and not game.gameOver():
+            game.endRound()
+
+    def randomPlayout(self, game):
+        choice = self.rng.choice
+        while not game.gameOver():
+            player = game.getPlayerToMove()
+            self.applyMove(game, player, choice(game.getOptions(player)))
+        return game.winner
+
+    def getRoot(self, game):
+        """
+        Returns the tree node for the current position, following the moves played since
+        the last decision down the previous tree when they were explored.
+        """
+        node = None
+        if self.root is not None and game.history is self.rootHistory and \
+                len(game.history) >= self.rootMoves:
+            node = self.root
+            for player, cardId in game.history[self.rootMoves:]:
+                node = node.children.get(cardId)
+                if node is None or node.player != player:
+                    node = None
+                    break
+        if node is None:
+            node = ISMCTSNode()
+        self.root = node
+        self.rootHistory = game.history
+        self.rootMoves = len(game.history)
+        return node
+
+    def iterate(self, root, game):
+        det = self.determinize(game)
+        node = root
+        path = [root]
+        while not det.gameOver():
+            player = det.getPlayerToMove()
+            legal = det.getOptions(player)
+            untried = []
+            for card in legal:
+                child = node.children.get(card.id)
+                if child is None:
+                    untried.append(card)
+                else:
+                    child.available += 1
+
+            if untried:
+                card = self.rng.choice(untried)
+                child = ISMCTSNode(card, player)
+                child.available = 1
+                node.children[card.id] = child
+                self.applyMove(det, player, card)
+                path.append(child)
+                break
+
+            best = None
+            bestScore = float('-inf')
+            for card in legal:
+                child = node.children[card.id]
+                score = float(child.wins) / child.visits + self.exploration * \
+                    math.sqrt(math.log(child.available) / child.visits)
+                if score > bestScore:
+                    best, bestScore = child, score
+            self.applyMove(det, player, best.card)
+            node = best
+            path.append(node)
+
+        winner = self.randomPlayout(det)
+        for node in path:
+            node.visits += 1
+            if node.player == winner:
+                node.wins += 1
+
+    def search(self, root, game, playouts):
+        start = time.perf_counter()
+        deadline = None if self.timeLimit is None else start + self.timeLimit
+        for i in range(playouts):
+            self.iterate(root, game)
+            if deadline is not None and time.perf_counter() > deadline:
+                break
+        if instrument.ENABLED:
+            instrument.record('ISMCTSAgent.search', start)
+            instrument.count('ismcts.playouts', i + 1 if playouts else 0)
+        return {cardId: child.visits for cardId, child in root.children.items()}
+
+    def chooseAction(self, cards, game):
+        if len(cards) == 1:
+            return cards[0]
+        if self.searchPool is None:
+            visits = self.search(self.getRoot(game), game, self.playouts)
+        else:
+            workers = self.searchPool.workers
+            tasks = [(self, game, self.playouts // workers + (i < self.playouts % workers),
+                      self.rng.getrandbits(32))
+                     for i in range(workers)]
+            visits = {}
+            for treeVisits in self.searchPool.map(_searchTree, tasks):
+                for cardId, n in treeVisits.items():
+                    visits[cardId] = visits.get(cardId, 0) + n
+        return max(cards, key=lambda c: visits.get(c.id, -1))
+
+    def getAttackCard(self, cards, game):
+        return self.chooseAction(cards, game)
+
+    def getDefendCard(self, cards, game):
+        return self.chooseAction(cards, game)
+
+
+## parallel search workers
+
+
+def _searchRootMove(task):
+    agent, game, card = task
+    agent.nodes = 0
+    value = None
+    for depth in range(agent.depth + 1):
+        value = agent.getChildValue(game, agent.playerNum, card, depth,
+                                    float('-inf'), float('+inf'))
+    return value, agent.nodes
+
+
+def _searchTree(task):
+    agent, game, playouts, seed = task
+    agent.rng = random.Random(seed)
+    return agent.search(ISMCTSNode(), game, playouts)
@@ -0,0 +1,338 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import agent as agt
+import durak2 as dk
+import play
+import util
+
+AGENT_TYPES = ['random', 'simple', 'reflex', 'simple++', 'ismcts']
+# games per pairing in the suite, set by the slower agent, before --scale
+SUITE_GAMES = {'random': 2000, 'simple': 2000, 'reflex': 500, 'simple++': 100, 'ismcts': 4}
+SUITE_PLAYOUTS = 100
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(
+        description='Measure Durak engine throughput in games per second.')
+    parser.add_argument('-a', '--agent', type=str, default='simple',
+                        choices=AGENT_TYPES, help="Agent type")
+    parser.add_argument('-o', '--opponent', type=str, default='simple',
+                        choices=AGENT_TYPES, help="Opponent type")
+    parser.add_argument('-n', '--numGames', type=int, default=20000,
+                        help="Number of games to play")
+    parser.add_argument('-s', '--seed', type=int, default=0,
+                        help="Master seed; each game is seeded from it and its index")
+    parser.add_argument('-g', '--game', type=int, default=None,
+                        help="Replay only this game of the run, e.g. to profile it")
+    parser.add_argument('--suite', action='store_true',
+                        help="Run the benchmark suite instead of a single pairing")
+    parser.add_argument('--only', type=str, nargs='+', default=None,
+                        help="Run only the suite benchmarks whose names start with these")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="Multiply the suite's iteration counts by this factor")
+    parser.add_argument('--json', type=str, default=None,
+                        help="Write the suite results to this file")
+    parser.add_argument('--baseline', type=str, default=None,
+                        help="Compare the suite results with an earlier --json file")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="Relative slowdown against the baseline reported as a regression")
+    return parser.parse_args()
+
+
+def gamesPerSecond(agents, numGames, masterSeed=0):
+    start = time.perf_counter()
+    play.playRange(agents, masterSeed, 0, numGames)
+    return numGames / (time.perf_counter() - start)
+
+
+## Benchmark suite
+
+
+@contextlib.contextmanager
+def quiet():
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def result(value, unit, higherIsBetter=True):
+    return {'value': value, 'unit': unit, 'higherIsBetter': higherIsBetter}
+
+
+def bestTime(fn, makeItems, repeat=3):
+    """
+    Returns the fastest of repeat timed passes of fn over the items returned by
+    makeItems, which is called untimed before each pass.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        items = makeItems()
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def samplePositions(numGames, masterSeed):
+    """
+    Plays numGames seeded random games and returns clones of their positions, split
+    into (attacker to move, defender to move, round over).
+    """
+    agents = [play.getAgent('random', 0), play.getAgent('random', 1)]
+    attacks, defends, roundEnds = [], [], []
+    for g in play.walkGames(agents, numGames, masterSeed):
+        if g.roundOver():
+            roundEnds.append(g.clone())
+        else:
+            (attacks if g.getPlayerToMove() == g.attacker else defends).append(g.clone())
+    return attacks, defends, roundEnds
+
+
+def benchPrimitives(scale, masterSeed):
+    attacks, defends, roundEnds = samplePositions(max(1, int(200 * scale)), masterSeed)
+    positions = attacks + defends
+    moves = [(g, g.getPlayerToMove()) for g in positions]
+    moves = [(g, player, g.getOptions(player)[0]) for g, player in moves]
+    states = [g.getState(player) for g, player, _ in moves]
+    g = dk.Durak(rng=random.Random(masterSeed))
+
+    def rate(fn, makeItems, n):
+        return result(n / bestTime(fn, makeItems), 'calls/sec')
+
+    return {
+        'durak.newGame': rate(lambda _: g.newGame(), lambda: range(len(positions)),
+                              len(positions)),
+        'durak.getAttackOptions': rate(lambda g: g.getAttackOptions(g.attacker),
+                                       lambda: attacks, len(attacks)),
+        'durak.getDefendOptions': rate(lambda g: g.getDefendOptions(int(not g.attacker)),
+                                       lambda: defends, len(defends)),
+        # playCard and endRound change the game, so every pass gets fresh clones
+        'durak.playCard': rate(lambda move: move[0].playCard(move[1], move[2]),
+                               lambda: [(g.clone(), player, card) for g, player, card in moves],
+                               len(moves)),
+        'durak.endRound': rate(lambda g: g.endRound(),
+                               lambda: [g.clone() for g in roundEnds], len(roundEnds)),
+        'durak.getState': rate(lambda move: move[0].getState(move[1]), lambda: moves,
+                               len(moves)),
+        'util.extractFeatures': rate(util.extractFeatures, lambda: states, len(states)),
+    }
+
+
+def benchGames(scale, masterSeed):
+    results = {}
+    for i, agentType in enumerate(AGENT_TYPES):
+        for opponentType in AGENT_TYPES[i:]:
+            with quiet():
+                agents = [play.getAgent(agentType, 0), play.getAgent(opponentType, 1)]
+            for agent in agents:
+                if hasattr(agent, 'playouts'):
+                    agent.playouts = SUITE_PLAYOUTS
+            numGames = max(1, int(scale * min(SUITE_GAMES[agentType],
+                                              SUITE_GAMES[opponentType])))
+            results['games.%s-%s' % (agentType, opponentType)] = result(
+                gamesPerSecond(agents, numGames, masterSeed), 'games/sec')
+    return results
+
+
+class TimedAgent(object):
+    """
+    Wraps an agent and records the seconds each of its decisions takes.
+    """
+    def __init__(self, agent):
+        self.agent = agent
+        self.latencies = []
+
+    def newGame(self, seed=None):
+        self.agent.newGame(seed)
+
+    def getAttackCard(self, cards, game):
+        return self.timed(self.agent.getAttackCard, cards, game)
+
+    def getDefendCard(self, cards, game):
+        return self.timed(self.agent.getDefendCard, cards, game)
+
+    def timed(self, choose, cards, game):
+        start = time.perf_counter()
+        card = choose(cards, game)
+        self.latencies.append(time.perf_counter() - start)
+        return card
+
+
+def benchDecisionLatency(scale, masterSeed):
+    with quiet():
+        agent = TimedAgent(play.getAgent('simple++', 0))
+    play.playRange([agent, play.getAgent('simple', 1)], masterSeed, 0, max(1, int(100 * scale)))
+    latencies = 1e3 * np.array(agent.latencies)
+    results = {}
+    for q in (50, 90, 99):
+        results['simple++.latency.p%d' % q] = result(float(np.percentile(latencies, q)), 'ms',
+                                                     higherIsBetter=False)
+    results['simple++.latency.max'] = result(float(latencies.max()), 'ms',
+                                             higherIsBetter=False)
+    return results
+
+
+def benchParallelSearch(scale, masterSeed):
+    """
+    Times simple++'s depth 3 root search serially and with root moves spread over a
+    search pool, on sampled endgame positions big enough for the pool to be used.
+    """
+    attacks, defends, _ = samplePositions(max(1, int(200 * scale)), masterSeed)
+    positions = [g for g in attacks + defends
+                 if len(g.deck) == 0 and len(g.getOptions(g.getPlayerToMove())) > 1 and
+                 len(g.hand[0]) + len(g.hand[1]) >= agt.SimpleEnhancedAgent.parallelMinCards]
+    positions = positions[:max(1, int(40 * scale))]
+    with quiet():
+        agents = [agt.SimpleEnhancedAgent(0, depth=3, exactEndgame=False),
+                  agt.SimpleEnhancedAgent(0, depth=3, exactEndgame=False,
+                                          workers=max(2, os.cpu_count() or 1))]
+    results = {}
+    for name, agent in zip(('serial', 'parallel'), agents):
+        if agent.searchPool is not None:
+            # pool start-up is not part of a move
+            agent.parallelMinimaxChoice(positions[0].getOptions(positions[0].getPlayerToMove()),
+                                        positions[0])
+        start = time.perf_counter()
+        for g in positions:
+            agent.tt.clear()
+            agent.playerNum = g.getPlayerToMove()
+            agent.minimaxChoice(g.getOptions(agent.playerNum), g)
+        results['search.%s' % name] = result(1e3 * (time.perf_counter() - start) / len(positions),
+                                             'ms/move', higherIsBetter=False)
+        if agent.searchPool is not None:
+            agent.searchPool.close()
+    return results
+
+
+def benchTraining(scale, masterSeed):
+    """
+    Times play.train and play.trainBatched with reflex agents and a token evaluation,
+    in a scratch directory since both write their checkpoint and results to the cwd.
+    """
+    numGames = max(1, int(100 * scale))
+    results = {}
+    for name, trainFn in (('train', play.train), ('trainBatched', play.trainBatched)):
+        args = argparse.Namespace(seed=masterSeed, agent='reflex', numGames=numGames,
+                                  workers=1, evalGames=1, evalOpponents=['random'],
+                                  batchSize=256, tdLambda=0.0)
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                with quiet():
+                    start = time.perf_counter()
+                    trainFn(args)
+                    seconds = time.perf_counter() - start
+            finally:
+                os.chdir(cwd)
+        results['%s.games' % name] = result(numGames / seconds, 'games/sec')
+    return results
+
+
+# each benchmark function and the prefixes of the results it returns
+SUITE = [(('durak.', 'util.'), benchPrimitives),
+         (('games.',), benchGames),
+         (('simple++.',), benchDecisionLatency),
+         (('search.',), benchParallelSearch),
+         (('train',), benchTraining)]
+
+
+def runSuite(scale, masterSeed, only=None):
+    """
+    Returns {name: result} of every suite benchmark, or with only, of those whose
+    names start with one of its prefixes.
+    """
+    results = {}
+    for prefixes, benchFn in SUITE:
+        if only is not None and not any(p.startswith(o) or o.startswith(p)
+                                        for p in prefixes for o in only):
+            continue
+        print(('Running %s...' % benchFn.__name__), file=sys.stderr)
+        results.update(benchFn(scale, masterSeed))
+    if only is not None:
+        results = {name: r for name, r in results.items()
+                   if any(name.startswith(o) for o in only)}
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints every result with its speedup over the baseline result of the same name, if
+    any, and returns the names of those more than tolerance slower.
+    """
+    regressions = []
+    for name, r in sorted(results.items()):
+        line = '%-32s %12.3f %-9s' % (name, r['value'], r['unit'])
+        base = baseline.get(name)
+        if base is not None and base['value'] > 0 and r['value'] > 0:
+            # above 1 is an improvement, whichever way the metric goes
+            speedup = r['value'] / base['value']
+            if not r['higherIsBetter']:
+                speedup = 1 / speedup
+            line += ' baseline %12.3f  x%.2f' % (base['value'], speedup)
+            if speedup < 1 - tolerance:
+                line += '  REGRESSION'
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def mainSuite(args):
+    results = runSuite(args.scale, args.seed, args.only)
+    if args.json is not None:
+        report = {
+            'meta': {
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'seed': args.seed,
+                'scale': args.scale,
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            },
+            'results': results,
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    baseline = {}
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(('%d regressions against %s: %s' %
+               (len(regressions), args.baseline, ', '.join(regressions))))
+        sys.exit(1)
+
+
+def main(args):
+    if args.suite:
+        mainSuite(args)
+        return
+    agents = [play.getAgent(args.agent, 0), play.getAgent(args.opponent, 1)]
+    if args.game is not None:
+        g = dk.Durak(rng=random.Random())
+        play.seedTournamentGame(g, agents, args.seed, args.game)
+        g.newGame()
+        winner = play.play(g, agents)
+        print(('Game %d: winner %d after %d plies' % (args.game, winner, len(g.history))))
+        return
+    rate = gamesPerSecond(agents, args.numGames, args.seed)
+    print(('%s vs %s: %.1f games/sec over %d games' %
+           (args.agent, args.opponent, rate, args.numGames)))
+
+
+if __name__ == '__main__':
+    main(parseArgs())
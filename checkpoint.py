@@ -0,0 +1,126 @@
+"""
+Training checkpoints: one file per training run holding a record per evaluation.
+
+The file is a 32-byte header (magic, format version, number of features, number of
+evaluation results) followed by fixed-size float64 records of
+[iteration, results..., attack weights..., defence weights...], so appending a record
+is a single write and readers can memory-map the file and index any record directly.
+"""
+import os
+import struct
+
+import numpy as np
+
+import util
+
+MAGIC = b'DURAKCKP'
+VERSION = 1
+_HEADER = struct.Struct('<8sIII12x')
+
+
+class CheckpointWriter(object):
+    """
+    Appends records to the checkpoint at path, creating it (or, unless append is set,
+    replacing it) with a header for numResults evaluation results per record.
+    """
+    def __init__(self, path, numResults, append=False):
+        self.path = path
+        self.numResults = numResults
+        if append and os.path.exists(path):
+            existing = Checkpoint(path)
+            if existing.numResults != numResults:
+                raise ValueError('%s holds %d results per record, not %d' %
+                                 (path, existing.numResults, numResults))
+            self.f = open(path, 'ab')
+        else:
+            self.f = open(path, 'wb')
+            self.f.write(_HEADER.pack(MAGIC, VERSION, util.NUM_FEATURES, numResults))
+            self.f.flush()
+
+    def append(self, iteration, results, w_atk, w_def):
+        """
+        Appends a record. results may be None for weights that were not evaluated.
+        """
+        if results is None:
+            results = [np.nan] * self.numResults
+        elif len(results) != self.numResults:
+            raise ValueError('Expected %d results, got %d' % (self.numResults, len(results)))
+        record = np.concatenate([[iteration], results, w_atk, w_def]).astype('<f8')
+        self.f.write(record.tobytes())
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+class Checkpoint(object):
+    """
+    A memory-mapped, read-only view of a checkpoint file. Records are only read from
+    disk when they are indexed.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise ValueError('%s is not a checkpoint file' % path)
+        magic, version, numFeatures, numResults = _HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError('%s is not a checkpoint file' % path)
+        if version != VERSION:
+            raise ValueError('%s has checkpoint format %d, expected %d' % (path, version, VERSION))
+        if numFeatures != util.NUM_FEATURES:
+            raise ValueError('%s holds %d features per weight vector, expected %d' %
+                             (path, numFeatures, util.NUM_FEATURES))
+        self.numResults = numResults
+        self.recordSize = 1 + numResults + 2 * numFeatures
+
+        # a partially written trailing record is ignored
+        numRecords = (os.path.getsize(path) - _HEADER.size) // (8 * self.recordSize)
+        if numRecords == 0:
+            self.records = np.empty((0, self.recordSize))
+        else:
+            self.records = np.memmap(path, dtype='<f8', mode='r', offset=_HEADER.size,
+                                     shape=(numRecords, self.recordSize))
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def iterations(self):
+        return self.records[:, 0]
+
+    def find(self, iteration):
+        """
+        Returns the index of the last record for iteration.
+        """
+        matches = np.flatnonzero(self.iterations == iteration)
+        if len(matches) == 0:
+            raise KeyError('No record for iteration %d in %s' % (iteration, self.path))
+        return int(matches[-1])
+
+    def getResults(self, index=-1):
+        return np.array(self.records[index, 1:1 + self.numResults])
+
+    def getWeights(self, index=-1):
+        """
+        Returns copies of (w_atk, w_def) of the record at index, the latest by default.
+        """
+        start = 1 + self.numResults
+        n = util.NUM_FEATURES
+        record = self.records[index]
+        return np.array(record[start:start + n]), np.array(record[start + n:start + 2 * n])
+
+
+def loadWeights(path, iteration=None):
+    """
+    Returns (w_atk, w_def) of the given iteration, or of the latest record, from the
+    checkpoint at path. Raises IOError if there is no such file and KeyError if it holds
+    no matching record.
+    """
+    checkpoint = Checkpoint(path)
+    if iteration is not None:
+        return checkpoint.getWeights(checkpoint.find(iteration))
+    if len(checkpoint) == 0:
+        raise KeyError('%s holds no records' % path)
+    return checkpoint.getWeights()
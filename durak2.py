@@ -1,27 +1,56 @@
+from collections import namedtuple
 from itertools import product
 import random
 
+import instrument
+
+
+class Card(object):
+    """
+    Cards are interned: the 36 deck cards and the END_ROUND sentinel are created once
+    at import, so Card(suit, rank) returns the shared instance and equality is identity.
+    Deck cards have a stable id in [0, 36) equal to 9 * suit + (rank - 6); the sentinel
+    has id 36.
+    """
+    __slots__ = ('suit', 'rank', 'id')
 
-class Card:
     SUITS = {0: 'C', 1: 'H', 2: 'D', 3: 'S'}
     ROYALS = {11: 'J', 12: 'Q', 13: 'K', 14: 'A'}
     RANKS = list(range(6, 14 + 1))
+    NUM_CARDS = 36
 
-    def __init__(self, suit, rank):
-        self.rank = rank
-        self.suit = suit
+    def __new__(cls, suit, rank):
+        try:
+            return _INTERNED[(suit, rank)]
+        except KeyError:
+            raise ValueError('No such card: suit %r, rank %r' % (suit, rank))
 
-    def __eq__(self, other):
-        return \
-            isinstance(other, self.__class__) and \
-            self.rank == other.rank and \
-            self.suit == other.suit
+    @classmethod
+    def _intern(cls, suit, rank, cardId):
+        card = object.__new__(cls)
+        object.__setattr__(card, 'suit', suit)
+        object.__setattr__(card, 'rank', rank)
+        object.__setattr__(card, 'id', cardId)
+        _INTERNED[(suit, rank)] = card
+        return card
 
-    def __ne__(self, other):
-        return not self.__eq__(other)
+    def __setattr__(self, name, value):
+        raise AttributeError('Cards are immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('Cards are immutable')
 
     def __hash__(self):
-        return hash((self.rank, self.suit))
+        return self.id
+
+    def __reduce__(self):
+        return Card.fromId, (self.id,)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
     def __repr__(self):
         rankString = Card.ROYALS.get(self.rank, str(self.rank))
@@ -34,37 +63,77 @@ class Card:
         return '%s of %s' % (rankString, suitString)
 
     @staticmethod
-    def getDeck(shuffle=True):
+    def fromId(cardId):
+        return _CARDS[cardId]
+
+    @staticmethod
+    def getDeck(shuffle=True, rng=None):
         """
-        Returns a shuffled deck of Durak cards.
+        Returns a shuffled deck of Durak cards, shuffled with rng (a random.Random, by
+        default the random module).
         Index 0 is the top of the deck, and index -1 is the bottom of the deck.
         """
-        deck = []
-        for suit, rank in product(Card.SUITS, Card.RANKS):
-            deck.append(Card(suit, rank))
+        deck = list(_DECK)
         if shuffle:
-            random.shuffle(deck)
+            (rng if rng is not None else random).shuffle(deck)
         return deck
 
 
+_INTERNED = {}
+_DECK = tuple(Card._intern(suit, rank, 9 * suit + rank - Card.RANKS[0])
+              for suit, rank in product(Card.SUITS, Card.RANKS))
+_CARDS = _DECK + (Card._intern(-1, -1, Card.NUM_CARDS),)
+_IDS = tuple(range(Card.NUM_CARDS))
+
+
+## precomputed masks and lookup tables for CardSet
+FULL_MASK = (1 << 36) - 1
+SUIT_MASKS = {suit: 0x1ff << (9 * suit) for suit in Card.SUITS}
+RANK_MASKS = {rank: sum(1 << (9 * suit + rank - Card.RANKS[0]) for suit in Card.SUITS)
+              for rank in Card.RANKS}
+# 9-bit suit sub-mask -> cards of that suit, in ascending rank order
+_SUIT_CARDS = {suit: [tuple(_DECK[9 * suit + i] for i in range(9) if m >> i & 1)
+                      for m in range(1 << 9)]
+               for suit in Card.SUITS}
+# 4-bit rank sub-mask (one bit per suit) -> cards of that rank, in ascending suit order
+_RANK_CARDS = {rank: [tuple(_DECK[9 * suit + rank - Card.RANKS[0]]
+                            for suit in Card.SUITS if m >> suit & 1)
+                      for m in range(1 << 4)]
+               for rank in Card.RANKS}
+# 9-bit rank mask -> set of ranks
+_RANK_SETS = [frozenset(Card.RANKS[i] for i in range(9) if m >> i & 1) for m in range(1 << 9)]
+# 9-bit rank mask -> the ranks in the order the set above iterates them, which is the
+# order attack options have always come in
+_RANK_ORDERS = [tuple(ranks) for ranks in _RANK_SETS]
+# 9-bit rank mask of the table -> mask of the cards that may attack on it
+_RANK_COVERS = [sum(RANK_MASKS[rank] for rank in ranks) for ranks in _RANK_SETS]
+_RANK_COVERS[0] = FULL_MASK
+# trump suit -> card id -> mask of the cards that beat the card
+BEATING_MASKS = {
+    trumpSuit: tuple((SUIT_MASKS[card.suit] & ~((2 << card.id) - 1)) |
+                     (SUIT_MASKS[trumpSuit] if card.suit != trumpSuit else 0)
+                     for card in _DECK)
+    for trumpSuit in Card.SUITS}
+
+
 class CardSet(object):
+    """
+    A set of cards stored as a single 36-bit integer mask, with bit i set for the card with id i.
+    """
     def __init__(self):
-        self.groupedByRank = {rank: set() for rank in Card.RANKS}
-        self.groupedBySuit = {suit: set() for suit in Card.SUITS}
-        self.size = 0
+        self.mask = 0
 
     def __len__(self):
-        return self.size
+        return self.mask.bit_count()
 
     def __repr__(self):
-        if self.size == 0:
+        if self.mask == 0:
             return '{}'
 
-        cards = ''
+        cards = []
         for rank in Card.RANKS:
-            for card in self.groupedByRank[rank]:
-                cards += repr(card) + ', '
-        return '{%s}' % cards[:-2]  # remove last ', '
+            cards.extend(repr(card) for card in self.getCardsForRank(rank))
+        return '{%s}' % ', '.join(cards)
 
     def __str__(self):
         return repr(self)
@@ -73,17 +142,15 @@ class CardSet(object):
         if not isinstance(card, Card):
             return False
 
-        return card in self.groupedByRank[card.rank] and card in self.groupedBySuit[card.suit]
+        return self.mask >> card.id & 1 == 1
 
     def addCard(self, card):
         if not isinstance(card, Card):
             raise TypeError('Tried to add something other than a Card to a CardSet')
-        if card in self:
-            return
+        if card.id >= Card.NUM_CARDS:
+            raise ValueError('Tried to add the END_ROUND sentinel to a CardSet')
 
-        self.groupedByRank[card.rank].add(card)
-        self.groupedBySuit[card.suit].add(card)
-        self.size += 1
+        self.mask |= 1 << card.id
 
     def addCards(self, cards):
         for card in cards:
@@ -92,68 +159,141 @@ class CardSet(object):
     def removeCard(self, card):
         if not isinstance(card, Card):
             raise TypeError('Tried to add something other than a Card to a CardSet')
-        if card not in self:
-            return
 
-        self.groupedByRank[card.rank].remove(card)
-        self.groupedBySuit[card.suit].remove(card)
-        self.size -= 1
+        self.mask &= ~(1 << card.id)
+
+    def copy(self):
+        cardSet = CardSet()
+        cardSet.mask = self.mask
+        return cardSet
+
+    def union(self, other):
+        """
+        Returns a new CardSet holding the cards of both sets, leaving both unchanged.
+        """
+        cardSet = CardSet()
+        cardSet.mask = self.mask | other.mask
+        return cardSet
 
     def getCardsForSuit(self, suit):
-        return self.groupedBySuit[suit]
+        return _SUIT_CARDS[suit][self.mask >> (9 * suit) & 0x1ff]
 
     def getCardsForRank(self, rank):
-        return self.groupedByRank[rank]
+        m = self.mask >> (rank - Card.RANKS[0])
+        return _RANK_CARDS[rank][(m & 1) | (m >> 8 & 2) | (m >> 16 & 4) | (m >> 24 & 8)]
 
 
 class Table(CardSet):
     def __init__(self):
         super(self.__class__, self).__init__()
         self.cards = []
-        self.seenRanks = set()
+        self.rankMask = 0
 
     def __len__(self):
         return len(self.cards)
 
     def __repr__(self):
-        return repr(self.cards)
+        return repr(self.cards[::-1])
 
     def __str__(self):
-        return str(self.cards)
+        return str(self.cards[::-1])
+
+    @property
+    def seenRanks(self):
+        return _RANK_SETS[self.rankMask]
 
     def addCard(self, card):
         super(self.__class__, self).addCard(card)
-        self.cards.insert(0, card)
-        self.seenRanks.add(card.rank)
+        self.cards.append(card)
+        self.rankMask |= 1 << (card.rank - Card.RANKS[0])
+
+    def copy(self):
+        table = Table()
+        table.mask = self.mask
+        table.cards = list(self.cards)
+        table.rankMask = self.rankMask
+        return table
 
     def getCards(self):
+        """
+        Returns the cards on the table in the order they were played.
+        """
         return self.cards
 
     def getTopCard(self):
-        return self.cards[0]
+        return self.cards[-1]
 
     def getSeenRanks(self):
         return self.seenRanks
 
     def clearTable(self):
-        self.__init__()
+        self.mask = 0
+        self.cards = []
+        self.rankMask = 0
+
+
+class GameState(namedtuple('GameState', ['isAttacker', 'trumpSuit', 'hand', 'knownOpponentHand',
+                                         'opponentHandSize', 'deckSize', 'table', 'tableRanks',
+                                         'topCard', 'trash', 'unseen'])):
+    """
+    An immutable snapshot of the game as one player sees it. Card sets are 36-bit masks
+    as in CardSet, tableRanks is the 9-bit mask of ranks on the table and topCard is the
+    last card played, or None on an empty table. Snapshots are cheap to create, hashable
+    and never change with the game; a hypothetical state, such as the hand with the
+    table picked up, is a new snapshot made with _replace.
+    """
+    __slots__ = ()
 
 
 class Durak:
     END_ROUND = Card(-1, -1)
 
-    def __init__(self):
+    def __init__(self, rng=None):
+        """
+        rng is the random.Random that deals and breaks first-attacker ties; by default
+        it is the random module. Seed it (e.g. g.rng.seed(seed)) before newGame to deal
+        a reproducible game.
+        """
+        self.rng = rng if rng is not None else random
+        # card ids reshuffled in place for every deal
+        self.deckIds = list(_IDS)
         self.newGame()
 
-    def newGame(self):
+    def __getstate__(self):
+        # the random module cannot be pickled; unpickled games fall back to it
+        state = self.__dict__.copy()
+        if state['rng'] is random:
+            state['rng'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.rng is None:
+            self.rng = random
+
+    def newGame(self, deck=None):
+        """
+        Deals a new game. If deck is given, it is used (top card first) instead of a
+        freshly shuffled deck.
+        """
         self.hand = [CardSet(), CardSet()]
-        self.deck = Card.getDeck()
+        if deck is None:
+            # the same deal as Card.getDeck(rng=self.rng), shuffling ids in a reused list
+            self.deckIds[:] = _IDS
+            self.rng.shuffle(self.deckIds)
+            self.deck = [_CARDS[cardId] for cardId in self.deckIds]
+        else:
+            self.deck = list(deck)
+        # the deal, top card first, for game logs
+        self.initialDeck = tuple(self.deck)
         self.table = Table()
         self.trash = CardSet()
         self.attacker = None
 
         self.roundWinner = None
         self.winner = None
+        # every (player, card id) played this game, in order
+        self.history = []
 
         ## card counting tools
         self.knownHand = [CardSet(), CardSet()]
@@ -178,7 +318,7 @@ class Durak:
         trumpsB = self.hand[1].getCardsForSuit(self.trumpCard.suit)
 
         if len(trumpsA) == 0 and len(trumpsB) == 0:
-            self.attacker = random.randint(0, 1)
+            self.attacker = self.rng.randint(0, 1)
         elif len(trumpsA) == 0:
             self.attacker = 1
         elif len(trumpsB) == 0:
@@ -190,33 +330,52 @@ class Durak:
 
         return self.attacker
 
+    def getPlayerToMove(self):
+        """
+        Returns the player whose turn it is in the current round: attacks and defences
+        alternate, so the attacker moves whenever the table holds an even number of cards.
+        """
+        if len(self.table.cards) % 2 == 0:
+            return self.attacker
+        return int(not self.attacker)
+
+    def getOptions(self, player):
+        """
+        Returns the attacking or defending options of player, whichever applies.
+        """
+        if player == self.attacker:
+            return self.getAttackOptions(player)
+        return self.getDefendOptions(player)
+
     def getAttackOptions(self, player):
         """
-        For a given player, returns a list of valid attacking options based on the game state.
-        If ending the round is an option, it is the last option in the list.
+        For a given player, returns a tuple of valid attacking options based on the game state.
+        If ending the round is an option, it is the last option in the tuple.
+        The options only depend on the player's cards of the ranks on the table, so they
+        are memoized on those and the same tuple is returned for equal keys.
         """
-        if len(self.table.getSeenRanks()) == 0:
-            cards = []
-            for rank in Card.RANKS:
-                cards.extend(self.hand[player].getCardsForRank(rank))
-        else:
-            cards = []
-            for rank in self.table.getSeenRanks():
-                cards.extend(self.hand[player].getCardsForRank(rank))
-            cards.append(Durak.END_ROUND)
+        rankMask = self.table.rankMask
+        key = (self.hand[player].mask & _RANK_COVERS[rankMask]) << 9 | rankMask
+        cards = _ATTACK_OPTIONS.get(key)
+        if cards is None:
+            if len(_ATTACK_OPTIONS) >= _MAX_ATTACK_OPTIONS:
+                _ATTACK_OPTIONS.clear()
+            cards = _ATTACK_OPTIONS[key] = _attackOptions(key >> 9, rankMask)
         return cards
 
     def getDefendOptions(self, player):
         """
-        For a given player, returns a list of valid defending options based on the game state.
-        Ending the round is always the last option in the list.
+        For a given player, returns a tuple of valid defending options based on the game state:
+        the higher cards of the top card's suit, then the trumps if it is not a trump.
+        Ending the round is always the last option in the tuple.
         """
-        topCard = self.table.getTopCard()
-        cards = [c for c in self.hand[player].getCardsForSuit(topCard.suit) if c.rank > topCard.rank]
-        if topCard.suit != self.trumpCard.suit:
-            cards.extend(self.hand[player].getCardsForSuit(self.trumpCard.suit))
-        cards.append(Durak.END_ROUND)
-        return cards
+        topCard = self.table.cards[-1]
+        trumpSuit = self.trumpCard.suit
+        beating = self.hand[player].mask & BEATING_MASKS[trumpSuit][topCard.id]
+        cards = _SUIT_CARDS[topCard.suit][beating >> 9 * topCard.suit & 0x1ff]
+        if topCard.suit != trumpSuit:
+            cards += _SUIT_CARDS[trumpSuit][beating >> 9 * trumpSuit & 0x1ff]
+        return cards + _END_ROUND_OPTION
 
     def playCard(self, player, card):
         if self.winner is not None:
@@ -225,6 +384,7 @@ class Durak:
             raise Exception('Tried to play a card for a finished round')
 
         opponent = int(not player)
+        self.history.append((player, card.id))
         if card == Durak.END_ROUND:
             self.roundWinner = opponent
             return
@@ -240,16 +400,18 @@ class Durak:
                 self.winner = player
 
     def refillHands(self):
-        while len(self.hand[self.attacker]) < 6 and len(self.deck) > 0:
-            card = self.deck.pop(0)
-            self.hand[self.attacker].addCard(card)
-            self.unseenCards[self.attacker].removeCard(card)
-
+        # Draws slice a new deck list rather than popping in place, so undo records can
+        # keep a reference to the previous deck instead of copying it.
+        drawn = 0
         defender = int(not self.attacker)
-        while len(self.hand[defender]) < 6 and len(self.deck) > 0:
-            card = self.deck.pop(0)
-            self.hand[defender].addCard(card)
-            self.unseenCards[defender].removeCard(card)
+        for player in (self.attacker, defender):
+            n = min(max(6 - len(self.hand[player]), 0), len(self.deck) - drawn)
+            for card in self.deck[drawn:drawn + n]:
+                self.hand[player].addCard(card)
+                self.unseenCards[player].removeCard(card)
+            drawn += n
+        if drawn > 0:
+            self.deck = self.deck[drawn:]
 
     def endRound(self):
         if self.roundWinner is None:
@@ -274,6 +436,71 @@ class Durak:
         if len(self.hand[self.attacker]) == 0 and len(self.deck) == 0:
             self.winner = self.attacker
 
+    ## undoable moves for search
+
+    def playCardUndoable(self, player, card):
+        """
+        Same as playCard, but returns an undo record that restores the state from
+        before the move when passed to undo.
+        """
+        record = self.getUndoRecord()
+        self.playCard(player, card)
+        return record
+
+    def endRoundUndoable(self):
+        """
+        Same as endRound, but returns an undo record that restores the state from
+        before the round ended when passed to undo.
+        """
+        record = self.getUndoRecord()
+        self.endRound()
+        return record
+
+    def getUndoRecord(self):
+        """
+        Returns a snapshot of the mutable game state as a tuple of masks and references.
+        Records must be undone in the reverse order they were taken.
+        """
+        table = self.table
+        return (self.hand[0].mask, self.hand[1].mask,
+                self.knownHand[0].mask, self.knownHand[1].mask,
+                self.unseenCards[0].mask, self.unseenCards[1].mask,
+                self.trash.mask, table.mask, table.rankMask, table.cards, len(table.cards),
+                self.deck, self.attacker, self.roundWinner, self.winner, len(self.history))
+
+    def undo(self, record):
+        (self.hand[0].mask, self.hand[1].mask,
+         self.knownHand[0].mask, self.knownHand[1].mask,
+         self.unseenCards[0].mask, self.unseenCards[1].mask,
+         self.trash.mask, self.table.mask, self.table.rankMask, tableCards, nTableCards,
+         self.deck, self.attacker, self.roundWinner, self.winner, nMoves) = record
+        del tableCards[nTableCards:]
+        self.table.cards = tableCards
+        del self.history[nMoves:]
+
+    def clone(self):
+        """
+        Returns an independent copy of the game, much cheaper than copy.deepcopy.
+        """
+        if instrument.ENABLED:
+            instrument.count('durak.clone')
+        game = Durak.__new__(Durak)
+        game.rng = self.rng
+        game.deckIds = list(self.deckIds)
+        game.hand = [self.hand[0].copy(), self.hand[1].copy()]
+        game.knownHand = [self.knownHand[0].copy(), self.knownHand[1].copy()]
+        game.unseenCards = [self.unseenCards[0].copy(), self.unseenCards[1].copy()]
+        game.trash = self.trash.copy()
+        game.table = self.table.copy()
+        game.deck = list(self.deck)
+        game.initialDeck = self.initialDeck
+        game.trumpCard = self.trumpCard
+        game.attacker = self.attacker
+        game.roundWinner = self.roundWinner
+        game.winner = self.winner
+        game.history = list(self.history)
+        return game
+
     def roundOver(self):
         # see playCard for deciding winners
         return self.roundWinner is not None
@@ -292,16 +519,45 @@ class Durak:
         return self.roundOver() and player == self.roundWinner
 
     def getState(self, player):
+        """
+        Returns a GameState snapshot of the game from player's point of view.
+        """
         opponent = int(not player)
-        state = {
-            'isAttacker': player == self.attacker,
-            'trumpSuit': self.trumpCard.suit,
-            'hand': self.hand[player],
-            'knownOpponentHand': self.knownHand[opponent],
-            'opponentHandSize': len(self.hand[opponent]),
-            'deckSize': len(self.deck),
-            'table': self.table,
-            'trash': self.trash,
-            'unseen': self.unseenCards[player]
-        }
-        return state
\ No newline at end of file
+        table = self.table
+        return tuple.__new__(GameState, (
+            player == self.attacker,
+            self.trumpCard.suit,
+            self.hand[player].mask,
+            self.knownHand[opponent].mask,
+            self.hand[opponent].mask.bit_count(),
+            len(self.deck),
+            table.mask,
+            table.rankMask,
+            table.cards[-1] if table.cards else None,
+            self.trash.mask,
+            self.unseenCards[player].mask,
+        ))
+
+
+## memoized move generation
+
+_END_ROUND_OPTION = (Durak.END_ROUND,)
+# (attacking cards of the hand) << 9 | table rank mask -> attack options
+_ATTACK_OPTIONS = {}
+_MAX_ATTACK_OPTIONS = 1 << 16
+
+
+def _attackOptions(handMask, rankMask):
+    """
+    Returns the attack options of the hand handMask on a table with ranks rankMask: all
+    cards rank by rank on an empty table, else the cards of the table's ranks followed
+    by END_ROUND.
+    """
+    hand = CardSet()
+    hand.mask = handMask
+    cards = []
+    for rank in _RANK_ORDERS[rankMask] if rankMask else Card.RANKS:
+        cards.extend(hand.getCardsForRank(rank))
+    if rankMask:
+        cards.append(Durak.END_ROUND)
+    return tuple(cards)
@@ -0,0 +1,231 @@
+"""
+Exact solver for two-player Durak once the deck is empty.
+
+With no cards left to draw, the opponent holds exactly the cards a player has not seen
+plus the cards the opponent is known to have picked up, so the game is one of perfect
+information. The solver searches it with boolean minimax over bitmask states (attacker
+hand, defender hand, table, top card) and memoizes the results under a canonical key
+that is shared by every trump suit.
+"""
+import time
+
+import durak2 as dk
+import instrument
+
+_RANK_SPREAD = sum(1 << (9 * suit) for suit in dk.Card.SUITS)
+
+
+def _compressTable(ranks):
+    """
+    Returns the table mapping a 9-bit suit mask to the same cards with the ranks missing
+    from the 9-bit rank mask ranks removed.
+    """
+    positions = [i for i in range(9) if ranks >> i & 1]
+    table = [0] * 512
+    for m in range(512):
+        table[m] = sum(1 << j for j, i in enumerate(positions) if m >> i & 1)
+    return table
+
+
+_COMPRESS = {}
+
+
+class SolveBudgetExceeded(Exception):
+    pass
+
+
+class EndgameSolver(object):
+    """
+    maxNodes bounds the new states expanded by one chooseCard call; positions that need
+    more raise SolveBudgetExceeded so the caller can fall back to a heuristic. Results
+    found before giving up stay memoized. The memo is cleared once it holds more than
+    maxStates results.
+    """
+    def __init__(self, maxNodes=10000, maxStates=1 << 19):
+        self.maxNodes = maxNodes
+        self.maxStates = maxStates
+        self.memo = {}
+        self.beating = dk.BEATING_MASKS
+        self.nodes = 0
+        self.solves = 0
+        self.solveSeconds = 0.0
+        self.maxSolveTime = 0.0
+        self.lastSolveTime = 0.0
+        self.lastNodes = 0
+        self.budgetExceeded = 0
+
+    def getStats(self):
+        return {
+            'solves': self.solves,
+            'nodes': self.nodes,
+            'states': len(self.memo),
+            'budgetExceeded': self.budgetExceeded,
+            'meanSolveTime': self.solveSeconds / self.solves if self.solves else 0.0,
+            'maxSolveTime': self.maxSolveTime,
+        }
+
+    def chooseCard(self, cards, game, player):
+        """
+        Returns the first card in cards that wins against perfect play, or None if the
+        position is lost. The game must have an empty deck and player must be to move.
+        Raises SolveBudgetExceeded if the position needs more than maxNodes new states.
+        """
+        if len(game.deck) > 0:
+            raise ValueError('The endgame solver needs an empty deck')
+
+        start = time.perf_counter()
+        startNodes = self.nodes
+        self._nodeLimit = self.nodes + self.maxNodes
+        trumpSuit = game.trumpCard.suit
+        if len(self.memo) > self.maxStates:
+            self.memo.clear()
+        self._memo = self.memo
+        self._beating = self.beating[trumpSuit]
+        self._trumpSuit = trumpSuit
+        self._trumpMask = dk.SUIT_MASKS[trumpSuit]
+        # bit offsets of the trump suit, then the other suits
+        self._suitShifts = [9 * trumpSuit] + [9 * suit for suit in dk.Card.SUITS
+                                              if suit != trumpSuit]
+
+        opponent = int(not player)
+        hand = game.hand[player].mask
+        opponentHand = (game.unseenCards[player].mask | game.knownHand[opponent].mask) & ~hand
+        table = game.table.mask
+
+        try:
+            choice = self._chooseCard(cards, game, player, hand, opponentHand, table)
+        except SolveBudgetExceeded:
+            self.budgetExceeded += 1
+            raise
+        finally:
+            self.lastSolveTime = time.perf_counter() - start
+            self.lastNodes = self.nodes - startNodes
+            self.solves += 1
+            self.solveSeconds += self.lastSolveTime
+            self.maxSolveTime = max(self.maxSolveTime, self.lastSolveTime)
+            if instrument.ENABLED:
+                instrument.record('EndgameSolver.chooseCard', start)
+                instrument.count('endgame.nodes', self.lastNodes)
+        return choice
+
+    def _chooseCard(self, cards, game, player, hand, opponentHand, table):
+        for card in cards:
+            if card == dk.Durak.END_ROUND:
+                if player == game.attacker:
+                    # the defender becomes the attacker on a cleared table
+                    wins = not self._attackerWins(opponentHand, hand, 0)
+                else:
+                    # the defender picks up and the attacker keeps attacking
+                    wins = not self._attackerWins(opponentHand, hand | table, 0)
+            else:
+                bit = 1 << card.id
+                if hand == bit:
+                    wins = True
+                elif player == game.attacker:
+                    wins = not self._defenderWins(hand ^ bit, opponentHand, table | bit, card.id)
+                else:
+                    wins = not self._attackerWins(opponentHand, hand ^ bit, table | bit)
+            if wins:
+                return card
+        return None
+
+    def _canonicalKey(self, attack, defend, table, top):
+        """
+        Returns a memo key shared by all states that play out the same way: ranks with no
+        card left in play are squeezed out, and the three non-trump suits, which are
+        interchangeable, are put in a fixed order.
+        """
+        present = attack | defend | table
+        ranks = (present | present >> 9 | present >> 18 | present >> 27) & 0x1ff
+        compress = _COMPRESS.get(ranks)
+        if compress is None:
+            compress = _COMPRESS[ranks] = _compressTable(ranks)
+
+        shifts = self._suitShifts
+        keys = [compress[attack >> shift & 0x1ff] |
+                compress[defend >> shift & 0x1ff] << 9 |
+                compress[table >> shift & 0x1ff] << 18
+                for shift in shifts]
+        if top >= 0:
+            keys[shifts.index(top // 9 * 9)] |= 1 << 27
+        trumpKey, k1, k2, k3 = keys
+        if k1 > k2:
+            k1, k2 = k2, k1
+        if k2 > k3:
+            k2, k3 = k3, k2
+            if k1 > k2:
+                k1, k2 = k2, k1
+
+        key = trumpKey | k1 << 28 | k2 << 56 | k3 << 84
+        if top >= 0:
+            topRank = (ranks & ((1 << top % 9) - 1)).bit_count()
+            key |= (topRank + 1) << 112
+        return key
+
+    def _attackerWins(self, attack, defend, table):
+        """
+        Returns whether the attacker, to move, wins.
+        """
+        key = self._canonicalKey(attack, defend, table, -1)
+        result = self._memo.get(key)
+        if result is not None:
+            return result
+        self.nodes += 1
+        if self.nodes > self._nodeLimit:
+            raise SolveBudgetExceeded()
+
+        if table == 0:
+            moves = attack
+        else:
+            ranks = (table | table >> 9 | table >> 18 | table >> 27) & 0x1ff
+            moves = attack & ranks * _RANK_SPREAD
+
+        result = False
+        # non-trumps first, each suit from low to high rank
+        moves = (moves & ~self._trumpMask) | (moves & self._trumpMask) << 36
+        while moves:
+            bit = moves & -moves
+            moves ^= bit
+            if bit >> 36:
+                bit >>= 36
+            if attack == bit or \
+                    not self._defenderWins(attack ^ bit, defend, table | bit, bit.bit_length() - 1):
+                result = True
+                break
+        else:
+            if table != 0:
+                # ending the attack discards the table and swaps roles
+                result = not self._attackerWins(defend, attack, 0)
+
+        self._memo[key] = result
+        return result
+
+    def _defenderWins(self, attack, defend, table, top):
+        """
+        Returns whether the defender, to move against the top card, wins.
+        """
+        key = self._canonicalKey(attack, defend, table, top)
+        result = self._memo.get(key)
+        if result is not None:
+            return result
+        self.nodes += 1
+        if self.nodes > self._nodeLimit:
+            raise SolveBudgetExceeded()
+
+        moves = defend & self._beating[top]
+        moves = (moves & ~self._trumpMask) | (moves & self._trumpMask) << 36
+        result = False
+        while moves:
+            bit = moves & -moves
+            moves ^= bit
+            if bit >> 36:
+                bit >>= 36
+            if defend == bit or not self._attackerWins(attack, defend ^ bit, table | bit):
+                result = True
+                break
+        else:
+            # picking up the table leaves the attacker to attack again
+            result = not self._attackerWins(attack, defend | table, 0)
+
+        self._memo[key] = result
+        return result
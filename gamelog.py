@@ -0,0 +1,140 @@
+"""
+Append-only binary logs of played games, and lazy replay of them.
+
+A log is a 9-byte header (magic and format version) followed by one record per game:
+the 36 card ids of the initial deck (top card first, as passed to Durak.newGame), the
+first attacker, the winner (255 if unfinished), a little-endian uint16 ply count and
+one byte per ply holding the player in bit 7 and the card id (36 for END_ROUND) in
+the low bits.
+"""
+import os
+import random
+import struct
+
+import durak2 as dk
+
+MAGIC = b'DURAKLOG'
+VERSION = 1
+_HEADER = struct.Struct('<8sB')
+_GAME = struct.Struct('<36sBBH')
+NO_WINNER = 255
+
+
+def encodeGame(g):
+    """
+    Returns the log record of the game g, which must have been dealt with newGame and
+    played from its first attacker.
+    """
+    history = g.history
+    firstAttacker = history[0][0] if history else g.attacker
+    winner = NO_WINNER if g.winner is None else g.winner
+    header = _GAME.pack(bytes(card.id for card in g.initialDeck), firstAttacker, winner,
+                        len(history))
+    return header + bytes(player << 7 | cardId for player, cardId in history)
+
+
+class GameLogWriter(object):
+    """
+    Appends games to the log at path, writing the file header if the file is new.
+    """
+    def __init__(self, path):
+        self.path = path
+        isNew = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not isNew:
+            with open(path, 'rb') as f:
+                _checkHeader(f.read(_HEADER.size), path)
+        self.f = open(path, 'ab')
+        if isNew:
+            self.f.write(_HEADER.pack(MAGIC, VERSION))
+        self.numGames = 0
+
+    def writeGame(self, g):
+        self.writeRecords([encodeGame(g)])
+
+    def writeRecords(self, records):
+        """
+        Appends records already encoded with encodeGame, e.g. by worker processes.
+        """
+        for record in records:
+            self.f.write(record)
+        self.numGames += len(records)
+
+    def close(self):
+        self.f.close()
+
+
+def _checkHeader(header, path):
+    if len(header) < _HEADER.size:
+        raise ValueError('%s is not a game log' % path)
+    magic, version = _HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError('%s is not a game log' % path)
+    if version != VERSION:
+        raise ValueError('%s has game log format %d, expected %d' % (path, version, VERSION))
+
+
+class GameRecord(object):
+    """
+    One logged game: the initial deck as card ids, the first attacker, the winner (None
+    if unfinished) and the plies as (player, card id) pairs.
+    """
+    __slots__ = ('deck', 'firstAttacker', 'winner', 'plies')
+
+    def __init__(self, deck, firstAttacker, winner, plies):
+        self.deck = deck
+        self.firstAttacker = firstAttacker
+        self.winner = winner
+        self.plies = plies
+
+    def newGame(self):
+        """
+        Returns a Durak dealt as this game was, before the first ply.
+        """
+        # the constructor deals a throwaway game, which must not draw from the random module
+        g = dk.Durak(rng=random.Random())
+        g.newGame(deck=[dk.Card.fromId(cardId) for cardId in self.deck])
+        g.attacker = self.firstAttacker
+        return g
+
+    def replay(self, g=None):
+        """
+        Yields (g, player, card) before each ply is played on g, then plays it, ending
+        rounds as play.play does. g is a single game that is advanced in place, so
+        anything kept between steps must be copied.
+        """
+        if g is None:
+            g = self.newGame()
+        for player, cardId in self.plies:
+            card = dk.Card.fromId(cardId)
+            yield g, player, card
+            g.playCard(player, card)
+            if g.roundOver() and not g.gameOver():
+                g.endRound()
+
+    def states(self):
+        """
+        Yields (player, state, card) for each ply: player's getState just before
+        playing card.
+        """
+        for g, player, card in self.replay():
+            yield player, g.getState(player), card
+
+
+def readGames(path):
+    """
+    Yields the GameRecords of the log at path one at a time, without reading the whole
+    file into memory.
+    """
+    with open(path, 'rb') as f:
+        _checkHeader(f.read(_HEADER.size), path)
+        while True:
+            header = f.read(_GAME.size)
+            if len(header) < _GAME.size:
+                return
+            deck, firstAttacker, winner, numPlies = _GAME.unpack(header)
+            plies = f.read(numPlies)
+            if len(plies) < numPlies:
+                return
+            yield GameRecord(tuple(deck), firstAttacker,
+                             None if winner == NO_WINNER else winner,
+                             [(ply >> 7, ply & 0x7f) for ply in plies])
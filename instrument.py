@@ -0,0 +1,122 @@
+"""
+Optional counters and timings for the game loop, the engine and the agents.
+
+Instrumented code checks the module-level ENABLED flag before doing anything else, so
+a disabled hook costs a global lookup and a branch. enable() starts a fresh Recorder
+that the hooks add to; report() summarizes it and writeTrace() exports its timed
+calls in the Chrome trace event format, which chrome://tracing, Perfetto
+(ui.perfetto.dev) and speedscope load. Only the process that called enable() is
+recorded: games played in worker processes are not.
+"""
+import collections
+import json
+import os
+import time
+
+ENABLED = False
+recorder = None
+
+
+class Recorder(object):
+    """
+    Named counters, and calls and total seconds per timed name. With trace, every
+    timed call is also kept as an event, up to maxEvents of them.
+    """
+    def __init__(self, trace=False, maxEvents=1 << 20):
+        self.counters = collections.Counter()
+        self.calls = collections.Counter()
+        self.seconds = collections.Counter()
+        self.events = [] if trace else None
+        self.maxEvents = maxEvents
+        self.droppedEvents = 0
+        self.origin = time.perf_counter()
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def record(self, name, start, end=None):
+        """
+        Records a call of name that ran from start to end (by default now), both
+        time.perf_counter() readings.
+        """
+        if end is None:
+            end = time.perf_counter()
+        self.calls[name] += 1
+        self.seconds[name] += end - start
+        if self.events is not None:
+            if len(self.events) < self.maxEvents:
+                self.events.append((name, start, end))
+            else:
+                self.droppedEvents += 1
+
+    def elapsed(self):
+        return time.perf_counter() - self.origin
+
+
+def enable(trace=False):
+    """
+    Turns the hooks on with a new Recorder and returns it.
+    """
+    global ENABLED, recorder
+    recorder = Recorder(trace)
+    ENABLED = True
+    return recorder
+
+
+def disable():
+    """
+    Turns the hooks off and returns the Recorder they were adding to.
+    """
+    global ENABLED
+    ENABLED = False
+    return recorder
+
+
+def count(name, n=1):
+    recorder.count(name, n)
+
+
+def record(name, start, end=None):
+    recorder.record(name, start, end)
+
+
+def report(rec=None):
+    """
+    Returns a text summary of rec (by default the current recorder): every timed name
+    by total time with its calls, mean and share of the wall time, then the counters.
+    """
+    rec = rec if rec is not None else recorder
+    wall = rec.elapsed()
+    lines = ['%-40s %10s %12s %12s %7s' % ('timed', 'calls', 'total ms', 'mean us', 'wall%')]
+    for name, seconds in rec.seconds.most_common():
+        calls = rec.calls[name]
+        lines.append('%-40s %10d %12.1f %12.1f %6.1f%%' %
+                     (name, calls, 1e3 * seconds, 1e6 * seconds / calls,
+                      100 * seconds / wall if wall else 0.0))
+    lines.append('%-40s %10s' % ('counter', 'count'))
+    for name, n in sorted(rec.counters.items()):
+        lines.append('%-40s %10d' % (name, n))
+    if rec.droppedEvents:
+        lines.append('%d trace events dropped past %d' % (rec.droppedEvents, rec.maxEvents))
+    return '\n'.join(lines)
+
+
+def writeTrace(path, rec=None):
+    """
+    Writes the timed calls of rec (by default the current recorder), which must have
+    been created with trace, as complete events in the Chrome trace event format,
+    followed by the final value of each counter.
+    """
+    rec = rec if rec is not None else recorder
+    if rec.events is None:
+        raise ValueError('The recorder was not created with trace')
+    pid = os.getpid()
+    events = [{'name': name, 'cat': name.split('.')[0], 'ph': 'X', 'pid': pid, 'tid': 0,
+               'ts': 1e6 * (start - rec.origin), 'dur': 1e6 * (end - start)}
+              for name, start, end in rec.events]
+    ts = 1e6 * rec.elapsed()
+    events.extend({'name': name, 'ph': 'C', 'pid': pid, 'tid': 0, 'ts': ts,
+                   'args': {'count': n}}
+                  for name, n in sorted(rec.counters.items()))
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
@@ -0,0 +1,122 @@
+"""
+Load test for server.py: simulates many concurrent players that each play a number of
+games against a bot, picking random legal moves, and reports the latency between a
+player's message and the server's reply that needs its next move.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import numpy as np
+
+import server
+import util
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description='Load test the Durak game server.')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help="Server address")
+    parser.add_argument('--port', type=int, default=8765, help="Server port")
+    parser.add_argument('-p', '--players', type=int, default=200,
+                        help="Number of concurrent players")
+    parser.add_argument('-n', '--numGames', type=int, default=1,
+                        help="Games each player plays")
+    parser.add_argument('-o', '--opponent', type=str, default='simple++',
+                        choices=server.OPPONENTS, help="Bot type to play against")
+    parser.add_argument('-s', '--seed', type=int, default=0,
+                        help="Master seed for the deals and the players' moves")
+    parser.add_argument('--thinkTime', type=float, default=0.0,
+                        help="Mean seconds a player waits before each move")
+    parser.add_argument('--local', action='store_true',
+                        help="Start a server in this process on a free port and test it")
+    return parser.parse_args()
+
+
+class LoadStats(object):
+    def __init__(self):
+        self.latencies = []
+        self.games = 0
+        self.wins = 0
+        self.moves = 0
+        self.errors = 0
+
+
+async def runPlayer(host, port, playerId, args, stats):
+    rng = random.Random(util.deriveSeed(args.seed, playerId))
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        stats.errors += 1
+        return
+
+    async def send(message):
+        writer.write((json.dumps(message) + '\n').encode())
+        await writer.drain()
+        return time.perf_counter()
+
+    try:
+        for gameIndex in range(args.numGames):
+            sent = await send({'op': 'new', 'opponent': args.opponent,
+                               'seed': util.deriveSeed(args.seed, playerId, gameIndex)})
+            while True:
+                line = await reader.readline()
+                if not line:
+                    stats.errors += 1
+                    return
+                message = json.loads(line)
+                event = message['event']
+                if event == 'played':
+                    continue
+                stats.latencies.append(time.perf_counter() - sent)
+                if event == 'state':
+                    if args.thinkTime > 0:
+                        await asyncio.sleep(rng.expovariate(1 / args.thinkTime))
+                    stats.moves += 1
+                    sent = await send({'op': 'play', 'card': rng.choice(message['options'])})
+                elif event == 'over':
+                    stats.games += 1
+                    stats.wins += message['won']
+                    break
+                else:
+                    stats.errors += 1
+                    return
+        await send({'op': 'quit'})
+    except (ConnectionError, ValueError):
+        stats.errors += 1
+    finally:
+        writer.close()
+
+
+async def loadTest(args):
+    host, port = args.host, args.port
+    gameServer = tcpServer = None
+    if args.local:
+        gameServer = server.GameServer([args.opponent])
+        tcpServer = await gameServer.start(host, 0)
+        port = tcpServer.sockets[0].getsockname()[1]
+
+    stats = LoadStats()
+    start = time.perf_counter()
+    await asyncio.gather(*[runPlayer(host, port, i, args, stats) for i in range(args.players)])
+    seconds = time.perf_counter() - start
+
+    if tcpServer is not None:
+        tcpServer.close()
+        await tcpServer.wait_closed()
+        gameServer.close()
+
+    print(('%d players, %d games (%d won), %d moves, %d errors in %.1f s: %.1f games/sec' %
+           (args.players, stats.games, stats.wins, stats.moves, stats.errors, seconds,
+            stats.games / seconds)))
+    if stats.latencies:
+        latencies = 1e3 * np.array(stats.latencies)
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        print(('Reply latency: p50 %.1f ms, p90 %.1f ms, p99 %.1f ms, max %.1f ms' %
+               (p50, p90, p99, latencies.max())))
+    return stats
+
+
+if __name__ == '__main__':
+    asyncio.run(loadTest(parseArgs()))
@@ -1,28 +1,77 @@
 import argparse
-import pickle
+import collections
+import copy
+import functools
+import multiprocessing
+import os
+import random
+import time
 import numpy as np
 
 import durak2 as dk
 import agent as agt
+import checkpoint
+import gamelog
+import instrument
+import selfplay
+import td
 import util
+import vecdurak
 
 
 def parseArgs():
     parser = argparse.ArgumentParser(
         description='Play a two-player game of Durak against a random-policy opponent.')
     parser.add_argument('-a', '--agent', type=str, default='simple',
-                        choices=['human', 'random', 'simple', 'reflex', 'simple++'], help="Agent type")
+                        choices=['human', 'random', 'simple', 'reflex', 'simple++', 'ismcts'], help="Agent type")
     parser.add_argument('-o', '--opponent', type=str, default='simple',
-                        choices=['human', 'random', 'simple', 'reflex', 'simple++'], help="Opponent type")
+                        choices=['human', 'random', 'simple', 'reflex', 'simple++', 'ismcts'], help="Opponent type")
     parser.add_argument('-v', '--verbose', type=int, default=2,
                          choices=[0, 1, 2], help="Verbosity of prompts")
     parser.add_argument('-n', '--numGames', type=int, default=100,
                         help="Number of games to play")
     parser.add_argument('-t', '--train', action='store_true', help='Train the AI')
+    parser.add_argument('--batchSize', type=int, default=None,
+                        help="Train from batches of self-play games in minibatches of this size")
+    parser.add_argument('--tdLambda', type=float, default=0.0,
+                        help="Lambda of the TD(lambda) targets used with --batchSize")
+    parser.add_argument('--evalGames', type=int, default=500,
+                        help="Games per opponent in each training evaluation")
+    parser.add_argument('--evalOpponents', type=str, nargs='+', default=['random', 'simple'],
+                        choices=['random', 'simple', 'reflex', 'simple++', 'ismcts'],
+                        help="Opponent types of each training evaluation")
+    parser.add_argument('--actors', type=int, default=0,
+                        help="Train from self-play streamed by this many actor processes")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="Number of processes to spread games across")
+    parser.add_argument('-s', '--seed', type=int, default=None,
+                        help="Master seed; each game gets its own seed derived from it")
+    parser.add_argument('--depth', type=int, default=2,
+                        help="Deepest search iteration for simple++, in its own moves")
+    parser.add_argument('--timeLimit', type=float, default=None,
+                        help="Search time budget per move for simple++ and ismcts, in seconds")
+    parser.add_argument('--playouts', type=int, default=500,
+                        help="Playouts per move for ismcts")
+    parser.add_argument('--searchWorkers', type=int, default=1,
+                        help="Processes each simple++/ismcts agent searches with")
+    parser.add_argument('--checkpoint', type=str, default=None,
+                        help="Checkpoint file to take reflex and simple++ weights from")
+    parser.add_argument('--iteration', type=int, default=None,
+                        help="Training iteration to load from --checkpoint (default: latest)")
+    parser.add_argument('--log', type=str, default=None,
+                        help="Append every game played to this game log file")
+    parser.add_argument('--vectorized', action='store_true',
+                        help='Play all games in lockstep with the NumPy engine (random/simple only)')
+    parser.add_argument('--interleave', type=int, default=1,
+                        help="Play this many games at a time, with one batched agent call "
+                             "per ply across them")
+    parser.add_argument('--profile', type=str, default=None,
+                        help="Print counters and timings of the run and write them to this "
+                             "file as a Chrome trace (main process only)")
     return parser.parse_args()
 
 
-def getAgent(agentType, playerNum):
+def getAgent(agentType, playerNum, args=None):
     if agentType == 'human':
         return agt.HumanAgent(playerNum)
     elif agentType == 'random':
@@ -30,9 +79,29 @@ def getAgent(agentType, playerNum):
     elif agentType == 'simple':
         return agt.SimpleAgent()
     elif agentType == 'reflex':
-        return agt.ReflexAgent(playerNum)
+        return loadCheckpoint(agt.ReflexAgent(playerNum), args)
     elif agentType == 'simple++':
-        return agt.SimpleEnhancedAgent(playerNum)
+        if args is None:
+            return agt.SimpleEnhancedAgent(playerNum)
+        return loadCheckpoint(
+            agt.SimpleEnhancedAgent(playerNum, depth=args.depth, timeLimit=args.timeLimit,
+                                    workers=args.searchWorkers), args)
+    elif agentType == 'ismcts':
+        if args is None:
+            return agt.ISMCTSAgent(playerNum)
+        return agt.ISMCTSAgent(playerNum, playouts=args.playouts, timeLimit=args.timeLimit,
+                               workers=args.searchWorkers)
+
+
+def loadCheckpoint(agent, args):
+    """
+    Gives agent the weights of --iteration (or the latest) from --checkpoint, if set.
+    """
+    if args is not None and args.checkpoint is not None:
+        w_atk, w_def = checkpoint.loadWeights(args.checkpoint, args.iteration)
+        agent.setAttackWeights(w_atk)
+        agent.setDefendWeights(w_def)
+    return agent
 
 
 def TDUpdate(state, nextState, reward, w, eta=1e-1):
@@ -48,6 +117,9 @@ def TDUpdate(state, nextState, reward, w, eta=1e-1):
 
 
 def train(args):
+    masterSeed = getMasterSeed(args)
+    seedGame(masterSeed)
+
     w_atk = np.random.normal(0, 1e-2, (util.NUM_FEATURES,))
     w_def = np.random.normal(0, 1e-2, (util.NUM_FEATURES,))
     w_atk[-1] = 0
@@ -58,6 +130,8 @@ def train(args):
         agent.setAttackWeights(w_atk)
         agent.setDefendWeights(w_def)
 
+    evaluator = getEvaluator(args, masterSeed)
+
     g = dk.Durak()
     for i in range(args.numGames):
         attacker = g.getFirstAttacker()
@@ -119,50 +193,232 @@ def train(args):
             defender = int(not attacker)
 
         if i % 50 == 0:
-            print(('Training iteration: %d / %d' % (i, args.numGames)))
-            randomAgent = agt.RandomAgent()
-            simpleAgent = agt.SimpleAgent()
-            winCounts = {'random': 0, 'simple': 0}
-            for _ in range(500):
-                winVsRandom = play(dk.Durak(), [randomAgent, agents[0]])
-                winVsSimple = play(dk.Durak(), [simpleAgent, agents[0]])
-                winCounts['random'] += winVsRandom
-                winCounts['simple'] += winVsSimple
-            with open('results.csv', 'a') as f:
-                row = [i, winCounts['random'], winCounts['simple']]
+            evaluate(args, evaluator, i, agents[0], w_atk, w_def)
+
+        g.newGame()
+
+    saveWeights(args, evaluator, w_atk, w_def)
+    return w_atk, w_def
+
+
+def trainBatched(args):
+    """
+    Like train, but plays 50 self-play games at a time with fixed weights (spread over
+    --workers processes), collects their transitions and then updates the weights in
+    minibatches of --batchSize with TD(--tdLambda).
+    """
+    masterSeed = getMasterSeed(args)
+    seedGame(masterSeed)
+
+    w_atk = np.random.normal(0, 1e-2, (util.NUM_FEATURES,))
+    w_def = np.random.normal(0, 1e-2, (util.NUM_FEATURES,))
+    w_atk[-1] = 0
+    w_def[-1] = 0
+    rng = np.random.default_rng(random.getrandbits(32))
+
+    agents = [getAgent(args.agent, 0), getAgent(args.agent, 1)]
+    pool = multiprocessing.Pool(args.workers) if args.workers > 1 else None
+    evaluator = getEvaluator(args, masterSeed)
+    buffer = td.ReplayBuffer()
+
+    for i in range(0, args.numGames, 50):
+        for agent in agents:
+            agent.setAttackWeights(w_atk)
+            agent.setDefendWeights(w_def)
+        evaluate(args, evaluator, i, agents[0], w_atk, w_def)
+
+        seeds = [util.deriveSeed(masterSeed, n) for n in range(i, min(i + 50, args.numGames))]
+        # contiguous chunks keep the buffer in game order for any number of workers
+        chunkSize = -(-len(seeds) // args.workers)
+        tasks = [(agents, seeds[start:start + chunkSize])
+                 for start in range(0, len(seeds), chunkSize)]
+        buffer.clear()
+        for experience in (map if pool is None else pool.map)(td._generateChunk, tasks):
+            buffer.extend(experience)
+        w_atk, w_def = td.trainOnBuffer(buffer, w_atk, w_def, args.batchSize,
+                                        tdLambda=args.tdLambda, rng=rng)
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    saveWeights(args, evaluator, w_atk, w_def)
+    return w_atk, w_def
+
+
+def trainSelfPlay(args):
+    """
+    Trains from --numGames games played by --actors actor processes while this process
+    learns, updating the shared weights every --batchSize transitions.
+    """
+    masterSeed = getMasterSeed(args)
+    seedGame(masterSeed)
+
+    w_atk = np.random.normal(0, 1e-2, (util.NUM_FEATURES,))
+    w_def = np.random.normal(0, 1e-2, (util.NUM_FEATURES,))
+    w_atk[-1] = 0
+    w_def[-1] = 0
+    agents = [getAgent(args.agent, 0), getAgent(args.agent, 1)]
+
+    w_atk, w_def, actorStats = selfplay.train(agents, w_atk, w_def, args.numGames,
+                                              args.actors, args.batchSize or 256,
+                                              args.tdLambda, masterSeed)
+    for actorId, (transitions, seconds) in sorted(actorStats.items()):
+        print(('Actor %d: %d transitions in %.1f s, %.0f transitions/sec' %
+               (actorId, transitions, seconds, transitions / seconds)))
+
+    for agent in agents:
+        agent.setAttackWeights(w_atk)
+        agent.setDefendWeights(w_def)
+    evaluator = getEvaluator(args, masterSeed)
+    evaluate(args, evaluator, args.numGames, agents[0], w_atk, w_def)
+    publishCheckpoint(args, evaluator)
+    return w_atk, w_def
+
+
+def getEvaluator(args, masterSeed):
+    """
+    Returns an evaluator checkpointing to this run's own file, agent-seed.ckpt, so the
+    agent.ckpt that agents load by default is untouched until the run finishes.
+    """
+    writer = checkpoint.CheckpointWriter('%s-%d.ckpt' % (args.agent, masterSeed),
+                                         len(args.evalOpponents))
+    return AsyncEvaluator(args.evalOpponents, args.evalGames, masterSeed, args.workers,
+                          checkpoint=writer)
+
+
+def publishCheckpoint(args, evaluator):
+    """
+    Waits for pending evaluations, then moves the run's checkpoint to agent.ckpt.
+    """
+    evaluator.close()
+    os.replace(evaluator.checkpoint.path, '%s.ckpt' % args.agent)
+
+
+def evaluate(args, evaluator, i, agent, w_atk, w_def):
+    """
+    Hands a snapshot of agent to the evaluator, which checkpoints it with its results.
+    """
+    print(('Training iteration: %d / %d' % (i, args.numGames)))
+    evaluator.submit(i, agent, w_atk, w_def)
+
+
+def saveWeights(args, evaluator, w_atk, w_def):
+    """
+    Waits for pending evaluations, appends the final, unevaluated weights to the
+    checkpoint and publishes it.
+    """
+    evaluator.flush(wait=True)
+    evaluator.checkpoint.append(args.numGames, None, w_atk, w_def)
+    publishCheckpoint(args, evaluator)
+
+
+class AsyncEvaluator(object):
+    """
+    Plays evaluation tournaments of agent snapshots in a background process pool, so
+    training goes on meanwhile. The snapshot plays numGames games as player 1 against
+    each opponent type, and a row of the iteration, its win counts and the weights is
+    appended to path, and to the checkpoint writer if given, once the results of it and
+    all earlier submissions are in.
+    """
+    def __init__(self, opponents=('random', 'simple'), numGames=500, masterSeed=0,
+                 workers=1, path='results.csv', checkpoint=None):
+        self.opponents = list(opponents)
+        self.numGames = numGames
+        self.masterSeed = masterSeed
+        self.path = path
+        self.checkpoint = checkpoint
+        self.pool = multiprocessing.Pool(max(1, workers))
+        self.pending = collections.deque()
+
+    def submit(self, i, agent, w_atk, w_def):
+        seeds = [util.deriveSeed(self.masterSeed, i, k) for k in range(len(self.opponents))]
+        task = (copy.deepcopy(agent), self.opponents, self.numGames, seeds)
+        result = self.pool.apply_async(_evaluateSnapshot, (task,))
+        self.pending.append((i, np.array(w_atk), np.array(w_def), result))
+        self.flush()
+
+    def flush(self, wait=False):
+        """
+        Writes the finished results at the head of the queue, or all of them if wait.
+        """
+        while self.pending and (wait or self.pending[0][3].ready()):
+            i, w_atk, w_def, result = self.pending.popleft()
+            winCounts, cacheStats = result.get()
+            if cacheStats is not None:
+                print(('Evaluation %d: value cache hit rate %.1f%% (%d hits, %d misses)' %
+                       (i, 100 * cacheStats['hitRate'], cacheStats['hits'],
+                        cacheStats['misses'])))
+            with open(self.path, 'a') as f:
+                row = [i] + winCounts
                 row.extend(w_atk)
                 row.extend(w_def)
                 np.savetxt(f, np.array(row)[:, None].T, delimiter=',', fmt='%.4e')
+            if self.checkpoint is not None:
+                self.checkpoint.append(i, winCounts, w_atk, w_def)
 
-            # save weights
-            with open('%s_attack_%d.bin' % (args.agent, i), 'w') as f_atk:
-                pickle.dump(w_atk, f_atk)
-            with open('%s_defend_%d.bin' % (args.agent, i), 'w') as f_def:
-                pickle.dump(w_def, f_def)
-
-        g.newGame()
+    def close(self):
+        self.flush(wait=True)
+        self.pool.close()
+        self.pool.join()
+        if self.checkpoint is not None:
+            self.checkpoint.close()
 
-    with open('%s_attack.bin' % args.agent, 'w') as f_atk:
-        pickle.dump(w_atk, f_atk)
-    with open('%s_defend.bin' % args.agent, 'w') as f_def:
-        pickle.dump(w_def, f_def)
 
-    return w_atk, w_def
+def _evaluateSnapshot(task):
+    """
+    Returns the snapshot's win counts and the statistics of its value cache, if any.
+    """
+    agent, opponents, numGames, seeds = task
+    # agent plays as player 1, so the sum of winners is its win count
+    winCounts = [sum(tournament([getAgent(opponent, 0), agent], numGames, seed))
+                 for opponent, seed in zip(opponents, seeds)]
+    values = getattr(agent, 'values', None)
+    return winCounts, None if values is None else values.getStats()
 
 
 def attack(g, playerNum, agent):
+    if instrument.ENABLED:
+        return instrumentedMove(g, playerNum, agent, True)
     actions = g.getAttackOptions(playerNum)
     card = agent.getAttackCard(actions, g)
     g.playCard(playerNum, card)
 
 
 def defend(g, playerNum, agent):
+    if instrument.ENABLED:
+        return instrumentedMove(g, playerNum, agent, False)
     actions = g.getDefendOptions(playerNum)
     card = agent.getDefendCard(actions, g)
     g.playCard(playerNum, card)
 
 
+def instrumentedMove(g, playerNum, agent, isAttack):
+    """
+    attack or defend, timing option generation, the agent's decision and playCard.
+    """
+    start = time.perf_counter()
+    if isAttack:
+        actions = g.getAttackOptions(playerNum)
+        decided = time.perf_counter()
+        instrument.record('durak.getAttackOptions', start, decided)
+        card = agent.getAttackCard(actions, g)
+        played = time.perf_counter()
+        instrument.record('%s.getAttackCard' % type(agent).__name__, decided, played)
+    else:
+        actions = g.getDefendOptions(playerNum)
+        decided = time.perf_counter()
+        instrument.record('durak.getDefendOptions', start, decided)
+        card = agent.getDefendCard(actions, g)
+        played = time.perf_counter()
+        instrument.record('%s.getDefendCard' % type(agent).__name__, decided, played)
+    g.playCard(playerNum, card)
+    instrument.record('durak.playCard', played)
+    instrument.count('decisions')
+
+
 def play(g, agents):
+    start = time.perf_counter() if instrument.ENABLED else None
     attacker = g.getFirstAttacker()
     defender = int(not attacker)
     while True:
@@ -187,29 +443,243 @@ def play(g, agents):
         attacker = g.attacker
         defender = int(not attacker)
 
+    if start is not None:
+        instrument.record('play.game', start)
+        instrument.count('games')
     return g.winner
 
 
+def mainVectorized(args):
+    for agentType in (args.agent, args.opponent):
+        if agentType not in vecdurak.POLICIES:
+            raise ValueError('--vectorized supports only %s agents' % '/'.join(vecdurak.POLICIES))
+    winCounts = vecdurak.playGames(args.agent, args.opponent, args.numGames,
+                                   seed=getMasterSeed(args))
+    print('Win percentages:')
+    print(('Agent: %d/%d' % (winCounts[0], args.numGames)))
+    print(('Opponent: %d/%d' % (winCounts[1], args.numGames)))
+
+
+def getMasterSeed(args):
+    if args.seed is not None:
+        return args.seed
+    masterSeed = random.randrange(2 ** 32)
+    print(('Master seed: %d' % masterSeed))
+    return masterSeed
+
+
+def seedGame(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def seedTournamentGame(g, agents, masterSeed, i):
+    """
+    Seeds game i of a tournament: g's rng, and each agent through newGame, from seeds
+    derived from masterSeed and i, so the game can be replayed on its own.
+    """
+    util.seedGameAndAgents(g, agents, util.deriveSeed(masterSeed, i))
+
+
+def walkGames(agents, numGames, masterSeed=0):
+    """
+    Plays games [0, numGames) of a tournament between agents and yields the game before
+    every step: ending a round if it is over, else the move of the player to move, which
+    the game's agent then chooses. Callers may inspect or search the game in between
+    but must leave it as they found it.
+    """
+    g = dk.Durak(rng=random.Random())
+    for i in range(numGames):
+        seedTournamentGame(g, agents, masterSeed, i)
+        g.newGame()
+        g.getFirstAttacker()
+        while not g.gameOver():
+            yield g
+            if g.roundOver():
+                g.endRound()
+                continue
+            player = g.getPlayerToMove()
+            if player == g.attacker:
+                card = agents[player].getAttackCard(g.getAttackOptions(player), g)
+            else:
+                card = agents[player].getDefendCard(g.getDefendOptions(player), g)
+            g.playCard(player, card)
+
+
+def playRange(agents, masterSeed, start, stop, record=False, interleave=1):
+    """
+    Plays games [start, stop) of a tournament, seeding each game from its index, and
+    returns their winners, or with record, (winners, game log records). With interleave
+    above 1, the games are played that many at a time by playInterleaved.
+    """
+    if interleave > 1:
+        return playInterleaved(agents, masterSeed, start, stop, interleave, record)
+    winners = []
+    records = []
+    g = dk.Durak(rng=random.Random())
+    for i in range(start, stop):
+        seedTournamentGame(g, agents, masterSeed, i)
+        g.newGame()
+        winners.append(play(g, agents))
+        if record:
+            records.append(gamelog.encodeGame(g))
+    return (winners, records) if record else winners
+
+
+def playInterleaved(agents, masterSeed, start, stop, k, record=False):
+    """
+    Like playRange, but keeps k games in progress and advances all of them one ply per
+    step, asking each agent for its moves in every game that waits on it with a single
+    getAttackCards or getDefendCards call. Games start from the same deals as in
+    playRange, and agents that decide from the position alone (simple, reflex) play
+    them identically; agents drawing random numbers or keeping per-game state see
+    their games interleaved, so those results depend on k.
+    """
+    winners = [None] * (stop - start)
+    records = [None] * (stop - start)
+    active = []
+    nextGame = start
+
+    def startGame(g):
+        seedTournamentGame(g, agents, masterSeed, nextGame)
+        g.newGame()
+        g.getFirstAttacker()
+        active.append((nextGame, g))
+        return nextGame + 1
+
+    for _ in range(min(k, stop - start)):
+        nextGame = startGame(dk.Durak(rng=random.Random()))
+
+    while active:
+        waiting = {}
+        for i, g in active:
+            player = g.getPlayerToMove()
+            waiting.setdefault((player, player == g.attacker), []).append(g)
+        for (player, isAttack), games in sorted(waiting.items()):
+            if isAttack:
+                options = [g.getAttackOptions(player) for g in games]
+                cards = agents[player].getAttackCards(options, games)
+            else:
+                options = [g.getDefendOptions(player) for g in games]
+                cards = agents[player].getDefendCards(options, games)
+            for g, card in zip(games, cards):
+                g.playCard(player, card)
+
+        playing = active
+        active = []
+        for i, g in playing:
+            if g.roundOver() and not g.gameOver():
+                g.endRound()
+            if not g.gameOver():
+                active.append((i, g))
+                continue
+            winners[i - start] = g.winner
+            if record:
+                records[i - start] = gamelog.encodeGame(g)
+            if nextGame < stop:
+                nextGame = startGame(g)
+    return (winners, records) if record else winners
+
+
+def tournament(agents, numGames, masterSeed, pool=None, chunkSize=None, log=None,
+               interleave=1):
+    """
+    Yields the winner of each game in order. With a multiprocessing pool, chunks of
+    games are played in the workers and streamed back as they finish; the results are
+    the same for a given master seed regardless of the number of workers. With a
+    gamelog.GameLogWriter, every game is also appended to the log, in order. interleave
+    is passed on to playRange.
+    """
+    if chunkSize is None:
+        chunkSize = numGames if pool is None else min(1000, -(-numGames // 64))
+    chunkSize = max(1, chunkSize)
+    chunks = [(start, min(start + chunkSize, numGames))
+              for start in range(0, numGames, chunkSize)]
+    playChunk = functools.partial(_playChunk, agents, masterSeed, log is not None, interleave)
+    results = map(playChunk, chunks) if pool is None else pool.imap(playChunk, chunks)
+    for winners in results:
+        if log is not None:
+            winners, records = winners
+            log.writeRecords(records)
+        for winner in winners:
+            yield winner
+
+
+def _playChunk(agents, masterSeed, record, interleave, chunk):
+    return playRange(agents, masterSeed, chunk[0], chunk[1], record, interleave)
+
+
 def main(args):
+    if args.workers > 1 and 'human' in (args.agent, args.opponent):
+        raise ValueError('Human players cannot be run with --workers')
+    if args.interleave > 1 and 'human' in (args.agent, args.opponent):
+        raise ValueError('Human players cannot be run with --interleave')
+    if args.workers > 1 and args.searchWorkers > 1:
+        raise ValueError('--searchWorkers cannot be combined with --workers')
+    masterSeed = getMasterSeed(args)
+    seedGame(masterSeed)
+
     winCounts = [0, 0]
     agents = [None, None]
-    agents[0] = getAgent(args.agent, 0)
-    agents[1] = getAgent(args.opponent, 1)
+    agents[0] = getAgent(args.agent, 0, args)
+    agents[1] = getAgent(args.opponent, 1, args)
 
-    g = dk.Durak()
-    for i in range(args.numGames):
-        winner = play(g, agents)
+    pool = multiprocessing.Pool(args.workers) if args.workers > 1 else None
+    log = gamelog.GameLogWriter(args.log) if args.log is not None else None
+    for i, winner in enumerate(tournament(agents, args.numGames, masterSeed, pool, log=log,
+                                          interleave=args.interleave)):
         winCounts[winner] += 1
         print(('Game %d winner: %d' % (i, winner)))
-        g.newGame()
+    if pool is not None:
+        pool.close()
+        pool.join()
+    if log is not None:
+        log.close()
     print('Win percentages:')
     print(('Agent: %d/%d' % (winCounts[0], args.numGames)))
     print(('Opponent: %d/%d' % (winCounts[1], args.numGames)))
+    if pool is None:
+        printSearchStats(agents)
+    for agent in agents:
+        if getattr(agent, 'searchPool', None) is not None:
+            agent.searchPool.close()
+
+
+def printSearchStats(agents):
+    for i, agent in enumerate(agents):
+        if hasattr(agent, 'values') and agent.values.hits + agent.values.misses > 0:
+            stats = agent.values.getStats()
+            print(('Player %d value cache: hit rate %.1f%% (%d hits, %d misses, %d entries)' %
+                   (i, 100 * stats['hitRate'], stats['hits'], stats['misses'], stats['size'])))
+        if hasattr(agent, 'getSearchStats'):
+            stats = agent.getSearchStats()
+            print(('Player %d search: %d moves, %d nodes, TT hit rate %.1f%%, '
+                   '%.1f ms/move (max %.1f ms)' %
+                   (i, stats['moves'], stats['nodes'], 100 * stats['ttHitRate'],
+                    1e3 * stats['meanMoveTime'], 1e3 * stats['maxMoveTime'])))
+            if 'endgameSolves' in stats:
+                print(('Player %d endgame solver: %d solves, %d unsolved within budget, '
+                       '%d memoized states, %.1f ms/solve (max %.1f ms)' %
+                       (i, stats['endgameSolves'], stats['endgameBudgetExceeded'],
+                        stats['endgameStates'], 1e3 * stats['endgameMeanSolveTime'],
+                        1e3 * stats['endgameMaxSolveTime'])))
 
 
 if __name__ == '__main__':
     args = parseArgs()
-    if args.train and args.agent in ['reflex']:
+    if args.profile is not None:
+        instrument.enable(trace=True)
+    if args.train and args.agent in ['reflex'] and args.actors > 0:
+        trainSelfPlay(args)
+    elif args.train and args.agent in ['reflex'] and args.batchSize:
+        trainBatched(args)
+    elif args.train and args.agent in ['reflex']:
         train(args)
+    elif args.vectorized:
+        mainVectorized(args)
     else:
-        main(args)
\ No newline at end of file
+        main(args)
+    if args.profile is not None:
+        instrument.disable()
+        print(instrument.report())
+        instrument.writeTrace(args.profile)
@@ -0,0 +1,125 @@
+import multiprocessing
+import random
+
+import durak2 as dk
+
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class ZobristHasher(object):
+    """
+    Zobrist keys over the parts of a Durak position that matter once the deck is empty:
+    both hands, the table and its top card, the attacker and the trump suit.
+    Each 36-bit mask is hashed with five per-byte lookup tables, so a key costs a fixed
+    number of lookups rather than a walk over the cards.
+    """
+    def __init__(self, seed=0x5eed):
+        rng = random.Random(seed)
+        cardKeys = [[rng.getrandbits(64) for _ in range(dk.Card.NUM_CARDS)] for _ in range(3)]
+        # one set of byte tables each for hand 0, hand 1 and the table
+        self.byteTables = [[self._byteTable(keys[8 * b:8 * b + 8] + [0] * 4) for b in range(5)]
+                           for keys in cardKeys]
+        self.topKeys = [rng.getrandbits(64) for _ in range(dk.Card.NUM_CARDS + 1)]
+        self.attackerKeys = [rng.getrandbits(64) for _ in range(2)]
+        self.trumpKeys = {suit: rng.getrandbits(64) for suit in dk.Card.SUITS}
+
+    @staticmethod
+    def _byteTable(keys):
+        table = [0] * 256
+        for m in range(1, 256):
+            low = m & -m
+            table[m] = table[m ^ low] ^ keys[low.bit_length() - 1]
+        return table
+
+    def hashMask(self, tables, mask):
+        return (tables[0][mask & 0xff] ^ tables[1][mask >> 8 & 0xff] ^
+                tables[2][mask >> 16 & 0xff] ^ tables[3][mask >> 24 & 0xff] ^
+                tables[4][mask >> 32])
+
+    def getKey(self, game):
+        table = game.table
+        top = table.cards[-1].id if table.cards else dk.Card.NUM_CARDS
+        return (self.hashMask(self.byteTables[0], game.hand[0].mask) ^
+                self.hashMask(self.byteTables[1], game.hand[1].mask) ^
+                self.hashMask(self.byteTables[2], table.mask) ^
+                self.topKeys[top] ^
+                self.attackerKeys[game.attacker] ^
+                self.trumpKeys[game.trumpCard.suit])
+
+
+class TranspositionTable(object):
+    """
+    A fixed-size, direct-mapped table of search results. A slot is replaced when it is
+    empty, was written in an earlier generation (i.e. an earlier move), or holds a
+    result searched no deeper than the new one. The probe and hit counters outlive
+    clear(), so they can be summed over many games; resetStats() zeroes them.
+    """
+    def __init__(self, size=1 << 16):
+        if size & (size - 1):
+            raise ValueError('Transposition table size must be a power of two')
+        self.size = size
+        self.clear()
+        self.resetStats()
+
+    def clear(self):
+        self.slots = [None] * self.size
+        self.generation = 0
+
+    def resetStats(self):
+        self.probes = 0
+        self.hits = 0
+
+    def newGeneration(self):
+        self.generation += 1
+
+    def probe(self, key):
+        """
+        Returns (depth, value, flag, bestMoveId) stored for key, or None.
+        """
+        self.probes += 1
+        entry = self.slots[key & (self.size - 1)]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1:5]
+        return None
+
+    def store(self, key, depth, value, flag, bestMoveId):
+        index = key & (self.size - 1)
+        entry = self.slots[index]
+        if entry is None or entry[5] != self.generation or depth >= entry[1]:
+            self.slots[index] = (key, depth, value, flag, bestMoveId, self.generation)
+
+
+ZOBRIST = ZobristHasher()
+
+
+class SearchPool(object):
+    """
+    A lazily created process pool for shared-nothing parallel search: every task gets
+    its own pickled copy of the agent and game, and map returns results in task order so
+    callers can merge them deterministically. Pools cannot be created inside daemonic
+    processes, such as play.py --workers tournament workers.
+    """
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool = None
+
+    def __getstate__(self):
+        return {'workers': self.workers, 'pool': None}
+
+    def map(self, fn, tasks):
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers)
+        return self.pool.map(fn, tasks, chunksize=1)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
@@ -0,0 +1,156 @@
+"""
+Parallel self-play: actor processes play games and stream their transitions to a
+learner, which updates the weights and broadcasts them back through shared memory.
+
+The weights live in a multiprocessing.shared_memory block guarded by a version
+counter used as a seqlock: the learner makes it odd while writing and even when done,
+and an actor only accepts a copy read between two equal, even versions. Actors check
+the version before each game, so new weights reach them without any pickling.
+"""
+import multiprocessing
+import queue
+import random
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import durak2 as dk
+import td
+import util
+
+
+class SharedWeights(object):
+    """
+    Attack and defence weights in shared memory, behind a seqlock version counter.
+    Create it in the learner and pass it to actor processes; it pickles by name.
+    """
+    def __init__(self, name=None):
+        size = 8 * (1 + 2 * util.NUM_FEATURES)
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.versionArray = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf)
+        self.weights = np.ndarray((2, util.NUM_FEATURES), dtype=np.float64,
+                                  buffer=self.shm.buf, offset=8)
+        if name is None:
+            self.versionArray[0] = 0
+
+    def __reduce__(self):
+        return SharedWeights, (self.shm.name,)
+
+    @property
+    def version(self):
+        return int(self.versionArray[0]) // 2
+
+    def write(self, w_atk, w_def):
+        self.versionArray[0] += 1
+        self.weights[0] = w_atk
+        self.weights[1] = w_def
+        self.versionArray[0] += 1
+
+    def read(self):
+        """
+        Returns (version, w_atk, w_def), retrying while a write is in progress.
+        """
+        while True:
+            before = int(self.versionArray[0])
+            if before & 1:
+                continue
+            weights = self.weights.copy()
+            if int(self.versionArray[0]) == before:
+                return before // 2, weights[0], weights[1]
+
+    def close(self):
+        del self.versionArray, self.weights
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def runActor(actorId, agents, weights, transitions, stop, masterSeed):
+    """
+    Plays self-play games until stop is set, putting one ReplayBuffer per game on the
+    transitions queue and finally a ('stats', actorId, transitions, seconds) tuple.
+    """
+    version = -1
+    numTransitions = 0
+    start = time.perf_counter()
+    g = dk.Durak(rng=random.Random())
+    gameIndex = 0
+    while not stop.is_set():
+        if weights.version != version:
+            version, w_atk, w_def = weights.read()
+            for agent in agents:
+                agent.setAttackWeights(w_atk)
+                agent.setDefendWeights(w_def)
+
+        util.seedGameAndAgents(g, agents, util.deriveSeed(masterSeed, actorId, gameIndex))
+        g.newGame()
+        experience = td.ReplayBuffer(64)
+        td.playExperienceGame(g, agents, experience)
+        gameIndex += 1
+        numTransitions += experience.size
+
+        while not stop.is_set():
+            try:
+                transitions.put(experience, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+
+    transitions.put(('stats', actorId, numTransitions, time.perf_counter() - start))
+    weights.close()
+
+
+def train(agents, w_atk, w_def, numGames, numActors=2, batchSize=256, tdLambda=0.0,
+          masterSeed=0, queueSize=64):
+    """
+    Runs numActors actor processes and learns in this process from the first numGames
+    games they send, updating the shared weights after every batchSize transitions.
+    Returns (w_atk, w_def, actorStats), where actorStats maps each actor id to
+    (transitions, seconds).
+    """
+    weights = SharedWeights()
+    w_atk = np.array(w_atk, dtype=float)
+    w_def = np.array(w_def, dtype=float)
+    weights.write(w_atk, w_def)
+    transitions = multiprocessing.Queue(queueSize)
+    stop = multiprocessing.Event()
+    actors = [multiprocessing.Process(target=runActor,
+                                      args=(i, agents, weights, transitions, stop, masterSeed))
+              for i in range(numActors)]
+    for actor in actors:
+        actor.start()
+
+    rng = np.random.default_rng(util.deriveSeed(masterSeed, numActors))
+    buffer = td.ReplayBuffer()
+    gamesSeen = 0
+    try:
+        while gamesSeen < numGames:
+            buffer.extend(transitions.get())
+            gamesSeen += 1
+            if buffer.size >= batchSize or gamesSeen == numGames:
+                w_atk, w_def = td.trainOnBuffer(buffer, w_atk, w_def, batchSize,
+                                                tdLambda=tdLambda, rng=rng)
+                weights.write(w_atk, w_def)
+                buffer.clear()
+    finally:
+        stop.set()
+        actorStats = {}
+        while len(actorStats) < numActors:
+            try:
+                message = transitions.get(timeout=0.1)
+            except queue.Empty:
+                if not any(actor.is_alive() for actor in actors):
+                    break
+                continue
+            if isinstance(message, tuple):
+                actorStats[message[1]] = message[2:]
+        for actor in actors:
+            actor.join()
+        weights.close()
+        weights.unlink()
+    return w_atk, w_def, actorStats
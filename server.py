@@ -0,0 +1,238 @@
+"""
+Asyncio game server hosting many concurrent Durak games between network players and bots.
+
+Clients connect over TCP and exchange one JSON object per line. A client is player 0
+and the bot it picks is player 1. Card ids are durak2 ids, with 36 for END_ROUND.
+
+Client to server:
+    {"op": "new", "opponent": "simple++", "seed": 7}   start a game (both optional)
+    {"op": "play", "card": 12}                        play one of the offered options
+    {"op": "quit"}
+
+Server to client:
+    {"event": "state", ...}      the client's turn: its hand, the table, the trump card,
+                                 deck and opponent hand sizes and its options
+    {"event": "played", ...}     the bot's move
+    {"event": "over", "won": b}  the game ended; the client may start another
+    {"event": "error", ...}      a bad request, which is otherwise ignored
+    {"event": "timeout"}         the client took too long; the connection is closed
+
+Bots decide in an executor, threads by default, so a searching bot does not hold up
+the other sessions. Each move has to arrive within moveTimeout seconds and each
+connection is closed after sessionTimeout seconds.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import copy
+import json
+import random
+
+import agent as agt
+import durak2 as dk
+import play
+import util
+
+OPPONENTS = ['random', 'simple', 'reflex', 'simple++', 'ismcts']
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description='Serve Durak games against bots over TCP.')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help="Address to listen on")
+    parser.add_argument('--port', type=int, default=8765, help="Port to listen on")
+    parser.add_argument('--opponents', type=str, nargs='+', default=['simple', 'simple++'],
+                        choices=OPPONENTS, help="Bot types clients may play against")
+    parser.add_argument('--moveTimeout', type=float, default=60.0,
+                        help="Seconds a client has for each message")
+    parser.add_argument('--sessionTimeout', type=float, default=3600.0,
+                        help="Seconds after which a connection is closed")
+    parser.add_argument('--executor', type=str, default='thread', choices=['thread', 'process'],
+                        help="Where bots decide: threads keep each bot's caches between "
+                             "moves, processes search in parallel on several cores")
+    parser.add_argument('--botWorkers', type=int, default=None,
+                        help="Number of executor threads or processes")
+    return parser.parse_args()
+
+
+class SessionTimeout(Exception):
+    pass
+
+
+def _botMove(bot, g, player):
+    """
+    Returns bot's card for player in g. Runs in the executor.
+    """
+    if player == g.attacker:
+        return bot.getAttackCard(g.getAttackOptions(player), g)
+    return bot.getDefendCard(g.getDefendOptions(player), g)
+
+
+def _stateMessage(g, player, options):
+    opponent = int(not player)
+    return {
+        'event': 'state',
+        'attacking': player == g.attacker,
+        'hand': [card.id for rank in dk.Card.RANKS for card in g.hand[player].getCardsForRank(rank)],
+        'table': [card.id for card in g.table.cards],
+        'trumpCard': g.trumpCard.id,
+        'deckSize': len(g.deck),
+        'opponentHandSize': len(g.hand[opponent]),
+        'options': [card.id for card in options],
+        'optionNames': [str(card) if card != dk.Durak.END_ROUND else 'end round'
+                        for card in options],
+    }
+
+
+class GameServer(object):
+    """
+    Serves games against bots copied from one prototype per opponent type, so bot
+    weights are loaded once rather than per session.
+    """
+    def __init__(self, opponents=('simple', 'simple++'), moveTimeout=60.0,
+                 sessionTimeout=3600.0, executor=None):
+        self.prototypes = {name: play.getAgent(name, 1) for name in opponents}
+        self.moveTimeout = moveTimeout
+        self.sessionTimeout = sessionTimeout
+        self.executor = executor if executor is not None else \
+            concurrent.futures.ThreadPoolExecutor()
+        self.activeSessions = 0
+        self.gamesPlayed = 0
+
+    async def start(self, host='127.0.0.1', port=8765):
+        return await asyncio.start_server(self.handle, host, port, backlog=1024)
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    async def handle(self, reader, writer):
+        self.activeSessions += 1
+        try:
+            await asyncio.wait_for(self.session(reader, writer), self.sessionTimeout)
+        except (SessionTimeout, asyncio.TimeoutError):
+            await self.send(writer, {'event': 'timeout'})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.activeSessions -= 1
+            writer.close()
+
+    async def send(self, writer, message):
+        try:
+            writer.write((json.dumps(message) + '\n').encode())
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def receive(self, reader, writer):
+        """
+        Returns the client's next request as a dict, or None once it disconnects.
+        Malformed lines are answered with an error and skipped.
+        """
+        while True:
+            try:
+                line = await asyncio.wait_for(reader.readline(), self.moveTimeout)
+            except asyncio.TimeoutError:
+                raise SessionTimeout()
+            except ValueError:
+                raise ConnectionError('Request line too long')
+            if not line:
+                return None
+            try:
+                request = json.loads(line)
+            except ValueError:
+                await self.send(writer, {'event': 'error', 'message': 'Invalid JSON'})
+                continue
+            if not isinstance(request, dict):
+                await self.send(writer, {'event': 'error', 'message': 'Expected an object'})
+                continue
+            return request
+
+    async def session(self, reader, writer):
+        while True:
+            request = await self.receive(reader, writer)
+            if request is None or request.get('op') == 'quit':
+                return
+            if request.get('op') != 'new':
+                await self.send(writer, {'event': 'error', 'message': 'No game in progress'})
+                continue
+            opponent = request.get('opponent', 'simple')
+            seed = request.get('seed')
+            if opponent not in self.prototypes:
+                await self.send(writer, {'event': 'error', 'message':
+                                         'Unknown opponent %r, expected one of %s' %
+                                         (opponent, ', '.join(sorted(self.prototypes)))})
+                continue
+            if seed is not None and (isinstance(seed, bool) or not isinstance(seed, int)):
+                await self.send(writer, {'event': 'error', 'message': 'seed must be an integer'})
+                continue
+            if not await self.playGame(reader, writer, opponent, seed):
+                return
+
+    async def playGame(self, reader, writer, opponent, seed):
+        """
+        Plays one game with the client as player 0. Returns False if the client left.
+        """
+        loop = asyncio.get_running_loop()
+        bot = copy.deepcopy(self.prototypes[opponent])
+        g = dk.Durak(rng=random.Random())
+        util.seedGameAndAgents(g, [agt.Agent(), bot],
+                               seed if seed is not None else random.getrandbits(32))
+        g.newGame()
+        g.getFirstAttacker()
+
+        while not g.gameOver():
+            player = g.getPlayerToMove()
+            if player == 1:
+                card = await loop.run_in_executor(self.executor, _botMove, bot, g, player)
+                await self.send(writer, {'event': 'played', 'card': card.id,
+                                         'name': str(card) if card != dk.Durak.END_ROUND
+                                         else 'end round'})
+            else:
+                options = g.getOptions(player)
+                await self.send(writer, _stateMessage(g, player, options))
+                card = None
+                while card is None:
+                    request = await self.receive(reader, writer)
+                    if request is None or request.get('op') == 'quit':
+                        return False
+                    cardId = request.get('card')
+                    # JSON true and false would otherwise pass as ints
+                    if request.get('op') == 'play' and not isinstance(cardId, bool) and \
+                            isinstance(cardId, int):
+                        card = next((c for c in options if c.id == cardId), None)
+                    if card is None:
+                        await self.send(writer, {'event': 'error',
+                                                 'message': 'Expected a play of one of %s' %
+                                                 [c.id for c in options]})
+            g.playCard(player, card)
+            if g.roundOver() and not g.gameOver():
+                g.endRound()
+
+        self.gamesPlayed += 1
+        await self.send(writer, {'event': 'over', 'won': g.isWinner(0)})
+        return True
+
+
+def getExecutor(kind, workers=None):
+    if kind == 'process':
+        return concurrent.futures.ProcessPoolExecutor(workers)
+    return concurrent.futures.ThreadPoolExecutor(workers)
+
+
+async def serve(args):
+    server = GameServer(args.opponents, args.moveTimeout, args.sessionTimeout,
+                        getExecutor(args.executor, args.botWorkers))
+    tcpServer = await server.start(args.host, args.port)
+    print(('Serving %s on %s:%d' % (', '.join(args.opponents), args.host, args.port)))
+    try:
+        async with tcpServer:
+            await tcpServer.serve_forever()
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(serve(parseArgs()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,234 @@
+"""
+Minibatched TD training for the linear-logistic attack and defence values.
+
+Experience generation and weight updates are decoupled: generateExperience plays
+self-play games with fixed weights and returns their transitions in a ReplayBuffer,
+so it can run in worker processes, and trainOnBuffer then sweeps the collected
+transitions in vectorized minibatches with TD(0) or TD(lambda) targets.
+"""
+import random
+
+import numpy as np
+
+import durak2 as dk
+import util
+
+ATTACK = 0
+DEFEND = 1
+
+
+class ReplayBuffer(object):
+    """
+    Preallocated transition arrays. Row t holds the features of a state, the features
+    of its successor, the reward, whether the successor is terminal (reward only),
+    which value function the state belongs to (ATTACK or DEFEND) and whether row t + 1
+    continues from row t's successor, which TD(lambda) uses to chain returns.
+    Capacity doubles when the buffer fills up.
+    """
+    FIELDS = ('features', 'nextFeatures', 'reward', 'terminal', 'kind', 'continues')
+
+    def __init__(self, capacity=1 << 14):
+        self.size = 0
+        self.capacity = capacity
+        self.features = np.zeros((capacity, util.NUM_FEATURES))
+        self.nextFeatures = np.zeros((capacity, util.NUM_FEATURES))
+        self.reward = np.zeros(capacity)
+        self.terminal = np.zeros(capacity, dtype=bool)
+        self.kind = np.zeros(capacity, dtype=np.int8)
+        self.continues = np.zeros(capacity, dtype=bool)
+
+    def __getstate__(self):
+        # only the filled rows are sent to other processes
+        state = {name: getattr(self, name)[:self.size].copy() for name in self.FIELDS}
+        state['size'] = self.size
+        state['capacity'] = max(self.size, 1)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.size == 0:
+            self._reserve(1)
+
+    def _reserve(self, n):
+        if self.size + n <= self.capacity:
+            return
+        while self.size + n > self.capacity:
+            self.capacity *= 2
+        for name in self.FIELDS:
+            old = getattr(self, name)
+            new = np.zeros((self.capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def clear(self):
+        self.size = 0
+
+    def addChain(self, kind, chain):
+        """
+        Appends a chain of transitions of one kind, each a tuple (mask, features,
+        nextMask, nextFeatures, reward) with nextFeatures None for terminal ones.
+        A transition continues into the next one when that starts from its successor.
+        """
+        self._reserve(len(chain))
+        for i, (mask, features, nextMask, nextFeatures, reward) in enumerate(chain):
+            t = self.size + i
+            self.features[t] = features
+            self.reward[t] = reward
+            self.kind[t] = kind
+            self.terminal[t] = nextFeatures is None
+            if nextFeatures is not None:
+                self.nextFeatures[t] = nextFeatures
+            self.continues[t] = (nextFeatures is not None and i + 1 < len(chain) and
+                                 chain[i + 1][0] == nextMask)
+        self.size += len(chain)
+
+    def extend(self, other):
+        self._reserve(other.size)
+        n = other.size
+        for name in self.FIELDS:
+            getattr(self, name)[self.size:self.size + n] = getattr(other, name)[:n]
+        self.size += n
+
+
+def _observe(g, player):
+    return g.hand[player].mask, util.extractFeatures(g.getState(player))
+
+
+def _playMove(g, player, agent, isAttack):
+    if isAttack:
+        card = agent.getAttackCard(g.getAttackOptions(player), g)
+    else:
+        card = agent.getDefendCard(g.getDefendOptions(player), g)
+    g.playCard(player, card)
+
+
+def playExperienceGame(g, agents, buffer):
+    """
+    Plays one game of g between agents and appends its transitions to buffer. The
+    transitions are the ones play.train learns from, with every state's features taken
+    when the state is observed.
+    """
+    chains = ([], [])
+
+    def transition(kind, state, nextState, reward):
+        if state is not None:
+            nextMask, nextFeatures = nextState if nextState is not None else (None, None)
+            chains[kind].append((state[0], state[1], nextMask, nextFeatures, reward))
+
+    attacker = g.getFirstAttacker()
+    defender = int(not attacker)
+    while True:
+        preAttack = None
+        preDefend = None
+        while True:
+            preAttack = _observe(g, attacker)
+            _playMove(g, attacker, agents[attacker], True)
+            postAttack = _observe(g, defender)
+            if g.roundOver():
+                break
+            transition(DEFEND, preDefend, postAttack, 0)
+
+            preDefend = postAttack
+            _playMove(g, defender, agents[defender], False)
+            postDefend = _observe(g, attacker)
+            if g.roundOver():
+                break
+            transition(ATTACK, preAttack, postDefend, 0)
+
+        if g.gameOver():
+            won = g.isWinner(attacker)
+            transition(ATTACK, _observe(g, attacker), None, int(won))
+            transition(DEFEND, _observe(g, defender), None, int(not won))
+            break
+
+        g.endRound()
+        if g.gameOver():
+            transition(DEFEND, _observe(g, defender), None, 1)
+            transition(ATTACK, _observe(g, attacker), None, 0)
+            break
+        transition(DEFEND, preDefend, _observe(g, defender), 0)
+        transition(ATTACK, preAttack, _observe(g, attacker), 0)
+
+        attacker = g.attacker
+        defender = int(not attacker)
+
+    buffer.addChain(ATTACK, chains[ATTACK])
+    buffer.addChain(DEFEND, chains[DEFEND])
+
+
+def generateExperience(agents, seeds):
+    """
+    Plays one self-play game per seed, seeding the deal and the agents from it, and
+    returns the transitions in a new ReplayBuffer.
+    """
+    buffer = ReplayBuffer(64 * max(1, len(seeds)))
+    g = dk.Durak(rng=random.Random())
+    for seed in seeds:
+        util.seedGameAndAgents(g, agents, seed)
+        g.newGame()
+        playExperienceGame(g, agents, buffer)
+    return buffer
+
+
+def _generateChunk(task):
+    return generateExperience(*task)
+
+
+def getValues(features, kinds, w_atk, w_def):
+    weights = np.where((kinds == ATTACK)[:, None], w_atk, w_def)
+    return util.logisticValues(weights, features)
+
+
+def lambdaReturns(buffer, w_atk, w_def, tdLambda):
+    """
+    Returns the TD(lambda) target of every transition in buffer under the given
+    weights. Returns are chained along continuing transitions; where a chain breaks,
+    the successor's value is the target's tail.
+    """
+    n = buffer.size
+    kinds = buffer.kind[:n]
+    nextValues = np.where(buffer.terminal[:n], 0.0,
+                          getValues(buffer.nextFeatures[:n], kinds, w_atk, w_def))
+    reward = buffer.reward[:n]
+    oneStep = reward + nextValues
+    mixed = reward + (1 - tdLambda) * nextValues
+    continues = buffer.continues[:n]
+    targets = np.empty(n)
+    following = 0.0
+    for t in range(n - 1, -1, -1):
+        if continues[t]:
+            following = targets[t] = mixed[t] + tdLambda * following
+        else:
+            following = targets[t] = oneStep[t]
+    return targets
+
+
+def trainOnBuffer(buffer, w_atk, w_def, batchSize=256, eta=1e-1, tdLambda=0.0, rng=None):
+    """
+    Sweeps buffer once in shuffled minibatches and returns the updated (w_atk, w_def).
+    eta scales the mean gradient of each minibatch. TD(0) targets use the current
+    weights; TD(lambda) targets are computed once per sweep with the starting weights.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    w_atk = np.array(w_atk, dtype=float)
+    w_def = np.array(w_def, dtype=float)
+    n = buffer.size
+    lambdaTargets = lambdaReturns(buffer, w_atk, w_def, tdLambda) if tdLambda > 0 else None
+
+    order = rng.permutation(n)
+    for start in range(0, n, batchSize):
+        batch = order[start:start + batchSize]
+        features = buffer.features[batch]
+        kinds = buffer.kind[batch]
+        if lambdaTargets is not None:
+            targets = lambdaTargets[batch]
+        else:
+            nextValues = getValues(buffer.nextFeatures[batch], kinds, w_atk, w_def)
+            targets = buffer.reward[batch] + np.where(buffer.terminal[batch], 0.0, nextValues)
+
+        values = getValues(features, kinds, w_atk, w_def)
+        gradients = ((targets - values) * values * (1 - values))[:, None] * features
+        isAttack = kinds == ATTACK
+        w_atk += eta * gradients[isAttack].sum(axis=0) / len(batch)
+        w_def += eta * gradients[~isAttack].sum(axis=0) / len(batch)
+    return w_atk, w_def
@@ -0,0 +1,94 @@
+import time
+
+import numpy as np
+import pytest
+
+import agent as agt
+import durak2 as dk
+import play
+import util
+
+
+@pytest.mark.parametrize('trumpSuit', dk.Card.SUITS)
+def test_simple_policy_table_matches_sort_policy(trumpSuit):
+    """
+    Every table entry is checked with a candidate list of each suit's lowest card and
+    all cards above it, in the rank-major order of attack options and, with at most one
+    non-trump suit, the suit-major order of defence options, each with and without
+    END_ROUND.
+    """
+    agent = agt.SimpleAgent()
+    for key in range(10 ** 4):
+        lows = [key // 10 ** (3 - suit) % 10 for suit in dk.Card.SUITS]
+        ids = [9 * suit + rank for suit in dk.Card.SUITS for rank in range(lows[suit], 9)]
+        orders = [sorted(ids, key=lambda cardId: (cardId % 9, cardId // 9))]
+        if sum(low < 9 for suit, low in enumerate(lows) if suit != trumpSuit) <= 1:
+            orders.append(sorted(ids, key=lambda cardId: (cardId // 9 == trumpSuit, cardId)))
+        for order in orders:
+            cards = [dk.Card.fromId(cardId) for cardId in order]
+            for candidates in (cards, cards + [dk.Durak.END_ROUND]):
+                if candidates:
+                    assert agent.policy(candidates, trumpSuit) is \
+                        agent.sortPolicy(candidates, trumpSuit), (trumpSuit, candidates)
+
+
+def test_simple_policy_matches_sort_policy_in_games():
+    agent = agt.SimpleAgent()
+    for g in play.walkGames([agt.SimpleAgent(), agt.SimpleAgent()], 1000):
+        if g.roundOver():
+            continue
+        cards = g.getOptions(g.getPlayerToMove())
+        assert agent.policy(cards, g.trumpCard.suit) is \
+            agent.sortPolicy(cards, g.trumpCard.suit), cards
+
+
+def test_parallel_search_ignores_earlier_deadline():
+    agents = [play.getAgent('random', 0), play.getAgent('random', 1)]
+    # the widest position is searched long enough for the deadline to be checked
+    g = max((g.clone() for g in play.walkGames(agents, 20)
+             if not g.roundOver() and len(g.deck) == 0 and
+             len(g.hand[0]) + len(g.hand[1]) >= agt.SimpleEnhancedAgent.parallelMinCards),
+            key=lambda g: len(g.getOptions(g.getPlayerToMove())))
+    player = g.getPlayerToMove()
+    agent = agt.SimpleEnhancedAgent(player, depth=3, timeLimit=0.2, exactEndgame=False,
+                                    workers=2)
+    try:
+        # a serial search leaves its deadline behind, long past by the next move
+        agent.deadline = time.perf_counter() - 1
+        options = g.getOptions(player)
+        assert agent.minimaxChoice(options, g) in options
+        assert agent.getSearchStats()['moves'] == 1
+    finally:
+        agent.searchPool.close()
+
+
+def test_reflex_choices_match_per_card_values():
+    """
+    chooseAction, and the batch getAttackCards and getDefendCards over all positions at
+    once, pick the first card of highest getValue at every move of seeded games.
+    """
+    rng = np.random.default_rng(0)
+    agents = [agt.ReflexAgent(0), agt.ReflexAgent(1)]
+    w_atk, w_def = rng.normal(0, 1, (2, util.NUM_FEATURES))
+    for agent in agents:
+        agent.setAttackWeights(w_atk)
+        agent.setDefendWeights(w_def)
+
+    positions = ([], [])
+    for g in play.walkGames(agents, 200):
+        if g.roundOver():
+            continue
+        player = g.getPlayerToMove()
+        agent = agents[player]
+        cards = g.getOptions(player)
+        expected = max(cards, key=lambda card: agent.getValue(card, g))
+        assert agent.chooseAction(cards, g) is expected
+        positions[player != g.attacker].append((player, g.clone(), cards, expected))
+
+    for isDefence, batchFn in ((False, 'getAttackCards'), (True, 'getDefendCards')):
+        for player in (0, 1):
+            batch = [(g, cards, expected) for p, g, cards, expected in positions[isDefence]
+                     if p == player]
+            choices = getattr(agents[player], batchFn)([cards for _, cards, _ in batch],
+                                                       [g for g, _, _ in batch])
+            assert choices == [expected for _, _, expected in batch]
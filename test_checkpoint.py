@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+import checkpoint
+import util
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'run.ckpt')
+    rng = np.random.default_rng(0)
+    records = [(i, [i, 2 * i], rng.normal(size=util.NUM_FEATURES),
+                rng.normal(size=util.NUM_FEATURES)) for i in (0, 50, 100)]
+    writer = checkpoint.CheckpointWriter(path, 2)
+    for i, results, w_atk, w_def in records:
+        writer.append(i, results, w_atk, w_def)
+    writer.append(150, None, records[-1][2], records[-1][3])
+    writer.close()
+
+    c = checkpoint.Checkpoint(path)
+    assert isinstance(c.records, np.memmap)
+    assert len(c) == 4
+    assert c.iterations.tolist() == [0, 50, 100, 150]
+    for index, (i, results, w_atk, w_def) in enumerate(records):
+        assert c.find(i) == index
+        assert c.getResults(index).tolist() == results
+        assert np.array_equal(c.getWeights(index)[0], w_atk)
+        assert np.array_equal(c.getWeights(index)[1], w_def)
+    assert np.isnan(c.getResults()).all()
+    with pytest.raises(KeyError):
+        c.find(25)
+
+    w_atk, w_def = checkpoint.loadWeights(path, 50)
+    assert np.array_equal(w_atk, records[1][2]) and np.array_equal(w_def, records[1][3])
+    w_atk, w_def = checkpoint.loadWeights(path)
+    assert np.array_equal(w_atk, records[-1][2]) and np.array_equal(w_def, records[-1][3])
+
+
+def test_append_to_existing(tmp_path):
+    path = str(tmp_path / 'run.ckpt')
+    w = np.zeros(util.NUM_FEATURES)
+    writer = checkpoint.CheckpointWriter(path, 1)
+    writer.append(0, [1], w, w)
+    writer.close()
+    writer = checkpoint.CheckpointWriter(path, 1, append=True)
+    writer.append(1, [2], w + 1, w)
+    writer.close()
+    assert checkpoint.Checkpoint(path).iterations.tolist() == [0, 1]
+    with pytest.raises(ValueError):
+        checkpoint.CheckpointWriter(path, 2, append=True)
+
+
+def test_partial_record_is_ignored(tmp_path):
+    path = str(tmp_path / 'run.ckpt')
+    w = np.zeros(util.NUM_FEATURES)
+    writer = checkpoint.CheckpointWriter(path, 1)
+    writer.append(0, [1], w, w)
+    writer.close()
+    with open(path, 'ab') as f:
+        f.write(b'\0' * 12)
+    assert len(checkpoint.Checkpoint(path)) == 1
+
+
+def test_mismatched_num_features_raises(tmp_path):
+    path = str(tmp_path / 'other.ckpt')
+    with open(path, 'wb') as f:
+        f.write(checkpoint._HEADER.pack(checkpoint.MAGIC, checkpoint.VERSION,
+                                        util.NUM_FEATURES + 1, 1))
+    with pytest.raises(ValueError):
+        checkpoint.Checkpoint(path)
+    with pytest.raises(ValueError):
+        checkpoint.loadWeights(path)
+
+
+def test_not_a_checkpoint_raises(tmp_path):
+    path = str(tmp_path / 'bad.ckpt')
+    with open(path, 'wb') as f:
+        f.write(b'x' * checkpoint._HEADER.size)
+    with pytest.raises(ValueError):
+        checkpoint.Checkpoint(path)
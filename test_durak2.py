@@ -0,0 +1,47 @@
+import random
+
+import durak2 as dk
+import play
+
+
+def snapshot(g):
+    return (g.hand[0].mask, g.hand[1].mask, g.knownHand[0].mask, g.knownHand[1].mask,
+            g.unseenCards[0].mask, g.unseenCards[1].mask, g.trash.mask,
+            g.table.mask, g.table.rankMask, list(g.table.cards), list(g.deck),
+            g.trumpCard, g.attacker, g.roundWinner, g.winner, list(g.history))
+
+
+def test_undo_restores_state_exactly():
+    """
+    At every position of 200 random games, each option is played (ending the round if
+    it is over) and undone, and the game must be exactly as before, including the
+    options it offers.
+    """
+    agents = [play.getAgent('random', 0), play.getAgent('random', 1)]
+    for g in play.walkGames(agents, 200):
+        before = snapshot(g)
+        if g.roundOver():
+            g.undo(g.endRoundUndoable())
+            assert snapshot(g) == before
+            continue
+        player = g.getPlayerToMove()
+        options = g.getOptions(player)
+        for card in options:
+            playRecord = g.playCardUndoable(player, card)
+            roundRecord = g.endRoundUndoable() if g.roundOver() else None
+            if roundRecord is not None:
+                g.undo(roundRecord)
+            g.undo(playRecord)
+            assert snapshot(g) == before, card
+            assert g.getOptions(player) == options
+
+
+def test_clone_is_independent():
+    g = dk.Durak(rng=random.Random(3))
+    g.newGame()
+    player = g.getFirstAttacker()
+    before = snapshot(g)
+    clone = g.clone()
+    clone.playCard(player, clone.getOptions(player)[0])
+    assert snapshot(g) == before
+    assert clone.initialDeck == g.initialDeck
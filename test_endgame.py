@@ -0,0 +1,63 @@
+import endgame
+import play
+
+
+def bruteForceWins(g, player, memo):
+    """
+    Returns whether player wins g, which has an empty deck, against perfect play, by
+    plain minimax over the game's own moves.
+    """
+    if g.gameOver():
+        return g.isWinner(player)
+    top = g.table.cards[-1].id if g.table.cards else -1
+    key = (g.hand[0].mask, g.hand[1].mask, g.table.mask, top, g.attacker, g.roundWinner)
+    result = memo.get(key)
+    if result is not None:
+        return result
+    if g.roundOver():
+        record = g.endRoundUndoable()
+        result = bruteForceWins(g, player, memo)
+        g.undo(record)
+    else:
+        mover = g.getPlayerToMove()
+        outcomes = []
+        for card in g.getOptions(mover):
+            record = g.playCardUndoable(mover, card)
+            outcomes.append(bruteForceWins(g, player, memo))
+            g.undo(record)
+        result = any(outcomes) if mover == player else all(outcomes)
+    memo[key] = result
+    return result
+
+
+def endgamePositions(numGames, maxCards, seed):
+    """
+    Returns clones of the positions of numGames seeded random games that have an empty
+    deck, at most maxCards cards in hand and a player to move with several options.
+    """
+    agents = [play.getAgent('random', 0), play.getAgent('random', 1)]
+    return [g.clone() for g in play.walkGames(agents, numGames, seed)
+            if not g.roundOver() and len(g.deck) == 0 and
+            len(g.hand[0]) + len(g.hand[1]) <= maxCards and
+            len(g.getOptions(g.getPlayerToMove())) > 1]
+
+
+def test_solver_matches_brute_force_minimax():
+    solver = endgame.EndgameSolver(maxNodes=1 << 20)
+    positions = endgamePositions(300, 6, 0)
+    assert len(positions) > 100
+    for g in positions:
+        player = g.getPlayerToMove()
+        options = g.getOptions(player)
+        card = solver.chooseCard(options, g, player)
+        memo = {}
+        wins = []
+        for option in options:
+            record = g.playCardUndoable(player, option)
+            wins.append(bruteForceWins(g, player, memo))
+            g.undo(record)
+        if card is None:
+            assert not any(wins)
+        else:
+            # the solver returns the first winning option
+            assert card is options[wins.index(True)]
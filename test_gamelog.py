@@ -0,0 +1,54 @@
+import multiprocessing
+import random
+
+import durak2 as dk
+import gamelog
+import play
+
+
+def test_logged_games_replay(tmp_path):
+    path = str(tmp_path / 'games.log')
+    agents = [play.getAgent('random', 0), play.getAgent('simple', 1)]
+    g = dk.Durak(rng=random.Random())
+    played = []
+    log = gamelog.GameLogWriter(path)
+    for i in range(200):
+        play.seedTournamentGame(g, agents, 0, i)
+        g.newGame()
+        winner = play.play(g, agents)
+        log.writeGame(g)
+        played.append((winner, list(g.history), g.initialDeck))
+    log.close()
+
+    records = list(gamelog.readGames(path))
+    assert len(records) == len(played)
+    for record, (winner, history, deck) in zip(records, played):
+        assert record.winner == winner
+        assert record.plies == history
+        assert record.deck == tuple(card.id for card in deck)
+        replayed = record.newGame()
+        for _ in record.replay(replayed):
+            pass
+        assert replayed.gameOver() and replayed.winner == winner
+        assert replayed.history == history
+        assert gamelog.encodeGame(replayed) == gamelog.encodeGame(replayed.clone())
+
+
+def test_worker_log_matches_serial_log(tmp_path):
+    agents = [play.getAgent('random', 0), play.getAgent('simple', 1)]
+    paths = []
+    for workers in (1, 2):
+        path = str(tmp_path / ('games%d.log' % workers))
+        log = gamelog.GameLogWriter(path)
+        pool = multiprocessing.Pool(workers) if workers > 1 else None
+        try:
+            winners = list(play.tournament(agents, 500, 7, pool, log=log))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        log.close()
+        assert [record.winner for record in gamelog.readGames(path)] == winners
+        paths.append(path)
+    with open(paths[0], 'rb') as f0, open(paths[1], 'rb') as f1:
+        assert f0.read() == f1.read()
@@ -0,0 +1,66 @@
+import asyncio
+import contextlib
+import json
+
+import server
+
+
+@contextlib.asynccontextmanager
+async def connect(moveTimeout=5.0):
+    """
+    Starts a server with the simple bot on a free port and yields a client connection.
+    """
+    gameServer = server.GameServer(['simple'], moveTimeout=moveTimeout)
+    tcpServer = await gameServer.start('127.0.0.1', 0)
+    port = tcpServer.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        yield reader, writer
+    finally:
+        writer.close()
+        tcpServer.close()
+        await tcpServer.wait_closed()
+        gameServer.close()
+
+
+async def request(reader, writer, line):
+    writer.write(line.encode() + b'\n')
+    await writer.drain()
+    return json.loads(await reader.readline())
+
+
+def test_bad_requests_get_errors():
+    async def run():
+        async with connect() as (reader, writer):
+            return [(await request(reader, writer, line))['event']
+                    for line in ['not json', '[1]', '{"op": "play", "card": 3}',
+                                 '{"op": "new", "opponent": "nobody"}',
+                                 '{"op": "new", "seed": true}']]
+
+    assert asyncio.run(run()) == ['error'] * 5
+
+
+def test_bool_card_is_rejected():
+    async def run():
+        async with connect() as (reader, writer):
+            message = await request(reader, writer, '{"op": "new", "seed": 14}')
+            while message['event'] != 'state':
+                message = json.loads(await reader.readline())
+            # these options include cards 0 and 1, which false and true would pass as
+            assert {0, 1} <= set(message['options'])
+            for value in ('true', 'false'):
+                reply = await request(reader, writer, '{"op": "play", "card": %s}' % value)
+                assert reply['event'] == 'error'
+            reply = await request(reader, writer,
+                                  '{"op": "play", "card": %d}' % message['options'][0])
+            assert reply['event'] in ('played', 'state', 'over')
+
+    asyncio.run(run())
+
+
+def test_idle_client_times_out():
+    async def run():
+        async with connect(moveTimeout=0.2) as (reader, writer):
+            return json.loads(await reader.readline())
+
+    assert asyncio.run(run())['event'] == 'timeout'
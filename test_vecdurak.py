@@ -0,0 +1,51 @@
+import random
+
+import pytest
+
+import agent as agt
+import durak2 as dk
+import play
+import vecdurak
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_simple_policy_matches_simple_agent(seed):
+    """
+    The same deals played with the simple policy in BatchDurak and with SimpleAgent in
+    durak2.Durak end with the same winners and final hands.
+    """
+    numGames = 1000
+    batch = vecdurak.BatchDurak(numGames, seed=seed)
+    winners = batch.run([vecdurak.simplePolicy, vecdurak.simplePolicy])
+    agents = [agt.SimpleAgent(), agt.SimpleAgent()]
+    g = dk.Durak(rng=random.Random())
+    for i in range(numGames):
+        g.newGame(deck=[dk.Card.fromId(cardId) for cardId in batch.decks[i]])
+        firstAttacker = g.getFirstAttacker()
+        trumps = dk.SUIT_MASKS[g.trumpCard.suit]
+        if (g.hand[0].mask | g.hand[1].mask) & trumps:
+            assert firstAttacker == batch.firstAttacker[i], 'game %d' % i
+        else:
+            # neither player holds a trump, and each engine flips its own coin
+            g.attacker = int(batch.firstAttacker[i])
+        attacker = g.attacker
+        while True:
+            play.attack(g, attacker, agents[attacker])
+            if not g.roundOver():
+                play.defend(g, int(not attacker), agents[int(not attacker)])
+            if g.gameOver():
+                break
+            if g.roundOver():
+                g.endRound()
+                if g.gameOver():
+                    break
+                attacker = g.attacker
+        assert g.winner == winners[i], 'game %d' % i
+        assert [g.hand[0].mask, g.hand[1].mask] == batch.hands[i].tolist(), 'game %d' % i
+
+
+def test_play_games_is_reproducible():
+    first = vecdurak.playGames('simple', 'random', 500, batchSize=200, seed=5)
+    second = vecdurak.playGames('simple', 'random', 500, batchSize=200, seed=5)
+    assert first.tolist() == second.tolist()
+    assert first.sum() == 500
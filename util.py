@@ -1,11 +1,13 @@
+import collections
 import math
 import durak2 as dk
+import instrument
 import numpy as np
 
 
 def readIntegerInRange(minimum, maximum, prompt=''):
     while True:
-        text = eval(input(prompt))
+        text = input(prompt)
         try:
             num = int(text)
             if num in range(minimum, maximum):
@@ -16,36 +18,125 @@ def readIntegerInRange(minimum, maximum, prompt=''):
             print("Not an int, try again")
 
 
+def deriveSeed(masterSeed, *keys):
+    """
+    Derives an independent 32-bit seed from a master seed and a path of integer keys,
+    e.g. deriveSeed(master, gameIndex). The result does not depend on how games are
+    split between processes.
+    """
+    return int(np.random.SeedSequence([masterSeed] + list(keys)).generate_state(1)[0])
+
+
+def seedGameAndAgents(g, agents, seed):
+    """
+    Seeds g's rng with the 32-bit seed and each agent with seed plus a per-player
+    offset above 32 bits, so the game and the agents draw from distinct streams.
+    """
+    g.rng.seed(seed)
+    for playerNum, agent in enumerate(agents):
+        agent.newGame(seed + (playerNum + 1 << 32))
+
+
 def logisticValue(weights, features):
     z = np.dot(weights, features)
     return 1.0 / (1 + math.exp(-z))
 
 
+def logisticValues(weights, features):
+    """
+    Row-wise logisticValue for matrices of weights and features.
+    """
+    z = (weights * features).sum(axis=1)
+    return 1.0 / (1 + np.exp(-z))
+
+
+class ValueCache(object):
+    """
+    A bounded LRU cache of evaluator values keyed by hand mask, trump suit, kind of
+    weights (ATTACK or DEFEND) and weights version. The features depend only on the
+    hand and the trump suit, so values stay valid across moves, search branches and
+    games until invalidate is called for new weights; that bumps the version, and
+    entries of older versions are never hit again and age out.
+    """
+    ATTACK = 0
+    DEFEND = 1
+
+    def __init__(self, maxSize=1 << 16):
+        self.maxSize = maxSize
+        self.entries = collections.OrderedDict()
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        # copies, e.g. agent snapshots sent to evaluation workers, start empty
+        return {'maxSize': self.maxSize, 'version': self.version}
+
+    def __setstate__(self, state):
+        self.__init__(state['maxSize'])
+        self.version = state['version']
+
+    def invalidate(self):
+        self.version += 1
+
+    def key(self, handMask, trumpSuit, kind):
+        return handMask | trumpSuit << 36 | kind << 38 | self.version << 39
+
+    def get(self, key):
+        """
+        Returns the value stored under key, or None.
+        """
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        if len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+    def getStats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': float(self.hits) / lookups if lookups else 0.0,
+            'size': len(self.entries),
+        }
+
+
 ### FEATURE EXTRACTION
 
 
+def _rankCover(ranks):
+    """
+    Returns the mask of all cards of the ranks in the 9-bit rank mask ranks.
+    """
+    return sum(dk.RANK_MASKS[rank] for i, rank in enumerate(dk.Card.RANKS) if ranks >> i & 1)
+
+
 def getNumOpponentMoves(state):
-    N = len(state['unseen'])
-    n = state['opponentHandSize'] - len(state['knownOpponentHand'])
+    N = state.unseen.bit_count()
+    n = state.opponentHandSize - state.knownOpponentHand.bit_count()
     K = 0
     nOpponentMoves = 0
 
-    if state['isAttacker'] and len(state['table']) > 0:
-        topCard = state['table'].getTopCard()
-        nOpponentMoves += len([c for c in state['knownOpponentHand'].getCardsForSuit(topCard.suit) if c.rank > topCard.rank])
-        K += len([c for c in state['unseen'].getCardsForSuit(topCard.suit) if c.rank > topCard.rank])
-        if topCard.suit != state['trumpSuit']:
-            nOpponentMoves += len(state['knownOpponentHand'].getCardsForSuit(state['trumpSuit']))
-            K += len(state['unseen'].getCardsForSuit(state['trumpSuit']))
+    if state.isAttacker and state.topCard is not None:
+        beating = dk.BEATING_MASKS[state.trumpSuit][state.topCard.id]
+        nOpponentMoves += (state.knownOpponentHand & beating).bit_count()
+        K += (state.unseen & beating).bit_count()
         if N > 0:
             nOpponentMoves += float(n * K) / N
-    elif state['isAttacker'] and len(state['table']) == 0:
-        nOpponentMoves = state['opponentHandSize']
-    elif not state['isAttacker']:
-        for rank in dk.Card.RANKS:
-            if rank in state['table'].seenRanks:
-                nOpponentMoves += len(state['knownOpponentHand'].getCardsForRank(rank))
-                K += len(state['unseen'].getCardsForRank(rank))
+    elif state.isAttacker:
+        nOpponentMoves = state.opponentHandSize
+    else:
+        cover = _rankCover(state.tableRanks)
+        nOpponentMoves += (state.knownOpponentHand & cover).bit_count()
+        K += (state.unseen & cover).bit_count()
         if N > 0:
             nOpponentMoves += float(n * K) / N
 
@@ -54,31 +145,113 @@ def getNumOpponentMoves(state):
 
 def getNumValidMoves(state):
     nValidMoves = 0
-    if state['isAttacker']:
-        for rank in state['table'].seenRanks:
-            nValidMoves += len(state['hand'].getCardsForRank(rank))
+    if state.isAttacker:
+        nValidMoves = (state.hand & _rankCover(state.tableRanks)).bit_count()
     return nValidMoves
 
 
 def getAverageRanks(state):
     averages = []
     for suit in dk.Card.SUITS:
-        sumRanks = sum(c.rank for c in state['hand'].getCardsForSuit(suit))
-        nCards = len(state['hand'].getCardsForSuit(suit))
-        if sumRanks == 0:
+        suitMask = state.hand >> 9 * suit & 0x1ff
+        ranks = [rank for i, rank in enumerate(dk.Card.RANKS) if suitMask >> i & 1]
+        if len(ranks) == 0:
             averages.append(0)
         else:
-            averages.append(float(sumRanks) / nCards)
+            averages.append(float(sum(ranks)) / len(ranks))
     return averages
 
 
-def extractFeatures(state):
+def _featureRows():
+    """
+    Returns rows[trumpSuit][suit][m], the features contributed by the cards of suit in
+    the 9-bit suit mask m, so the features of a hand are the sum of one row per suit.
+    The bias feature is carried by the suit 0 rows.
+    """
+    rows = np.zeros((4, 4, 512, NUM_FEATURES))
+    for m in range(512):
+        ranks = [i for i in range(9) if m >> i & 1]
+        nCards = len(ranks)
+        for suit in dk.Card.SUITS:
+            row = rows[:, suit, m]
+            if nCards:
+                row[:, suit] = float(sum(dk.Card.RANKS[i] for i in ranks)) / nCards
+            row[:, [4 + i for i in ranks]] = 1
+            row[:, 13 + suit] = nCards
+            row[suit, 17] = nCards
+            if suit == 0:
+                row[:, 18] = 1.0
+    return rows
+
+
+def featuresFromMask(handMask, trumpSuit, out=None):
+    """
+    Returns the features of the hand with card mask handMask, written into out if given.
+    """
+    if instrument.ENABLED:
+        instrument.count('util.featuresFromMask')
+    if out is None:
+        out = np.empty(NUM_FEATURES)
+    rows = _FEATURE_ROWS[trumpSuit]
+    np.add(rows[0][handMask & 0x1ff], rows[1][handMask >> 9 & 0x1ff], out=out)
+    out += rows[2][handMask >> 18 & 0x1ff]
+    out += rows[3][handMask >> 27]
+    return out
+
+
+def removalFeatures(handMask, trumpSuit, cardIds):
+    """
+    Returns the features of the hand handMask with each of cardIds removed, one row per
+    id; the END_ROUND id removes nothing. Removing a card only changes the row of its
+    suit, so each row is the hand's features plus a two-row delta.
+    """
+    if instrument.ENABLED:
+        instrument.count('util.removalFeatures', len(cardIds))
+    rows = _FEATURE_ROWS[trumpSuit].reshape(4 * 512, NUM_FEATURES)
+    before = []
+    after = []
+    for cardId in cardIds:
+        if cardId == dk.Card.NUM_CARDS:
+            before.append(0)
+            after.append(0)
+        else:
+            suit = cardId // 9
+            index = suit * 512 + (handMask >> 9 * suit & 0x1ff)
+            before.append(index)
+            after.append(index ^ 1 << cardId % 9)
+    return featuresFromMask(handMask, trumpSuit) + (rows[after] - rows[before])
+
+
+def featuresFromMasks(handMasks, trumpSuits):
+    """
+    Row-wise featuresFromMask for int64 arrays of hand masks and trump suits.
+    """
+    features = (_FEATURE_ROWS[trumpSuits, 0, handMasks & 0x1ff] +
+                _FEATURE_ROWS[trumpSuits, 1, handMasks >> 9 & 0x1ff])
+    features += _FEATURE_ROWS[trumpSuits, 2, handMasks >> 18 & 0x1ff]
+    features += _FEATURE_ROWS[trumpSuits, 3, handMasks >> 27]
+    return features
+
+
+def removalFeaturesMany(handMasks, trumpSuits, cardIds):
+    """
+    Row-wise removalFeatures for int64 arrays of hand masks, trump suits and single
+    card ids, computed with the same arithmetic so the rows match it exactly.
+    """
+    isCard = cardIds < dk.Card.NUM_CARDS
+    suits = np.where(isCard, cardIds // 9, 0)
+    before = np.where(isCard, suits * 512 + (handMasks >> 9 * suits & 0x1ff), 0)
+    after = np.where(isCard, before ^ 1 << cardIds % 9, 0)
+    rows = _FEATURE_ROWS.reshape(4, 4 * 512, NUM_FEATURES)
+    return featuresFromMasks(handMasks, trumpSuits) + (rows[trumpSuits, after] -
+                                                       rows[trumpSuits, before])
+
+
+def extractFeatures(state, out=None):
     # nValidMoves = getNumValidMoves(state)
     # nOpponentMoves = getNumOpponentMoves(state)
-    avgRanks = getAverageRanks(state)
-    cardsPerRank = [len(state['hand'].getCardsForRank(rank)) for rank in dk.Card.RANKS]
-    cardsPerSuit = [len(state['hand'].getCardsForSuit(suit)) for suit in dk.Card.SUITS]
-    nTrumpCards = len(state['hand'].getCardsForSuit(state['trumpSuit']))
-    return np.array(avgRanks + cardsPerRank + cardsPerSuit + [nTrumpCards, 1.0])
+    # average rank per suit, cards per rank, cards per suit, trump cards, bias
+    return featuresFromMask(state.hand, state.trumpSuit, out)
 
-NUM_FEATURES = 4 + 9 + 4 + 2
\ No newline at end of file
+NUM_FEATURES = 4 + 9 + 4 + 2
+_FEATURE_ROWS = _featureRows()
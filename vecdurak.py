@@ -0,0 +1,237 @@
+"""
+Batched Durak engine that advances many games in lockstep with NumPy.
+
+Each game is a row in a set of arrays: hands are 36-bit card masks (bit i is the card
+with durak2 id i), decks are rows of card ids with a draw pointer, and attacker, table
+and round state are per-game vectors. The rules mirror durak2.Durak exactly, so the
+built-in random and simple policies can replace per-game Python loops when evaluating.
+"""
+import numpy as np
+
+import durak2 as dk
+
+NUM_CARDS = dk.Card.NUM_CARDS
+END_ROUND = dk.Durak.END_ROUND.id
+HAND_SIZE = 6
+
+_IDS = np.arange(NUM_CARDS, dtype=np.int64)
+_SUITS = _IDS // 9
+_RANKS = _IDS % 9
+_SUIT_MASKS = np.array([0x1ff << (9 * suit) for suit in dk.Card.SUITS], dtype=np.int64)
+# multiplying a 9-bit rank mask by this copies it into every suit
+_RANK_SPREAD = np.int64(sum(1 << (9 * suit) for suit in dk.Card.SUITS))
+# card ids ordered by (rank, suit), the order SimpleAgent breaks ties in
+_RANK_MAJOR = np.lexsort((_SUITS, _RANKS))
+
+
+def _bitMatrix(masks):
+    return (masks[:, None] >> _IDS) & 1
+
+
+def _popcount(masks):
+    return _bitMatrix(masks).sum(axis=1)
+
+
+def _lowestCard(masks):
+    """
+    Returns the id of the lowest set bit of each mask, or END_ROUND for empty masks.
+    """
+    bits = _bitMatrix(masks)
+    return np.where(masks != 0, bits.argmax(axis=1), END_ROUND)
+
+
+def _rankMask(masks):
+    return (masks | masks >> 9 | masks >> 18 | masks >> 27) & 0x1ff
+
+
+def randomPolicy(legal, hasEnd, trumpSuit, rng):
+    """
+    Picks uniformly among the legal cards and, where allowed, ending the round.
+    """
+    bits = _bitMatrix(legal)
+    nCards = bits.sum(axis=1)
+    pick = (rng.random(len(legal)) * (nCards + hasEnd)).astype(np.int64)
+    index = (bits.cumsum(axis=1) > pick[:, None]).argmax(axis=1)
+    return np.where(pick < nCards, index, END_ROUND)
+
+
+def simplePolicy(legal, hasEnd, trumpSuit, rng):
+    """
+    Vectorized SimpleAgent.policy: the lowest non-trump card (ties broken by suit), else
+    the lowest trump, else ending the round.
+    """
+    trumps = legal & _SUIT_MASKS[trumpSuit]
+    nonTrumps = legal & ~_SUIT_MASKS[trumpSuit]
+    bits = _bitMatrix(nonTrumps)[:, _RANK_MAJOR]
+    lowestNonTrump = _RANK_MAJOR[bits.argmax(axis=1)]
+    return np.where(nonTrumps != 0, lowestNonTrump, _lowestCard(trumps))
+
+
+POLICIES = {'random': randomPolicy, 'simple': simplePolicy}
+
+
+class BatchDurak(object):
+    def __init__(self, numGames, seed=None):
+        self.numGames = numGames
+        self.rng = np.random.default_rng(seed)
+        self.newGames()
+
+    def newGames(self):
+        """
+        Deals numGames new games and picks their first attackers. The shuffled decks are
+        kept in self.decks (top card first) so the same deals can be replayed in durak2.
+        """
+        n = self.numGames
+        self.decks = self.rng.permuted(np.tile(_IDS, (n, 1)), axis=1)
+
+        # like Durak.newGame: the top card is the trump and goes to the bottom
+        self.deck = np.concatenate([self.decks[:, 1:], self.decks[:, :1]], axis=1)
+        self.trumpSuit = _SUITS[self.decks[:, 0]]
+        cardBits = np.int64(1) << self.deck
+        self.hands = np.stack([np.bitwise_or.reduce(cardBits[:, :HAND_SIZE], axis=1),
+                               np.bitwise_or.reduce(cardBits[:, HAND_SIZE:2 * HAND_SIZE], axis=1)],
+                              axis=1)
+        self.deckPos = np.full(n, 2 * HAND_SIZE, dtype=np.int64)
+
+        self.table = np.zeros(n, dtype=np.int64)
+        self.tableSize = np.zeros(n, dtype=np.int64)
+        self.topCard = np.full(n, END_ROUND, dtype=np.int64)
+        self.trash = np.zeros(n, dtype=np.int64)
+        self.roundWinner = np.full(n, -1, dtype=np.int64)
+        self.winner = np.full(n, -1, dtype=np.int64)
+
+        # like Durak.getFirstAttacker: the lowest trump attacks first
+        trumpMasks = _SUIT_MASKS[self.trumpSuit]
+        lowestA = _lowestCard(self.hands[:, 0] & trumpMasks)
+        lowestB = _lowestCard(self.hands[:, 1] & trumpMasks)
+        coinFlip = self.rng.integers(0, 2, n)
+        noTrumps = (lowestA == END_ROUND) & (lowestB == END_ROUND)
+        self.attacker = np.where(noTrumps, coinFlip, (lowestA > lowestB).astype(np.int64))
+        self.firstAttacker = self.attacker.copy()
+
+    def gameOver(self):
+        return self.winner >= 0
+
+    def allOver(self):
+        return bool(np.all(self.winner >= 0))
+
+    def getOptions(self):
+        """
+        Returns (games, player, isAttack, legal, hasEnd) for every unfinished game: the
+        player to move and the legal card mask, matching getAttackOptions and
+        getDefendOptions.
+        """
+        games = np.flatnonzero(self.winner < 0)
+        isAttack = self.tableSize[games] % 2 == 0
+        attacker = self.attacker[games]
+        player = np.where(isAttack, attacker, 1 - attacker)
+        hand = self.hands[games, player]
+        table = self.table[games]
+
+        attackMask = np.where(table == 0, hand, hand & (_rankMask(table) * _RANK_SPREAD))
+
+        topCard = self.topCard[games] % NUM_CARDS
+        topSuit = _SUITS[topCard]
+        trumpSuit = self.trumpSuit[games]
+        higher = _SUIT_MASKS[topSuit] & ~((np.int64(2) << topCard) - 1)
+        beating = higher | np.where(topSuit != trumpSuit, _SUIT_MASKS[trumpSuit], 0)
+        defendMask = hand & beating
+
+        legal = np.where(isAttack, attackMask, defendMask)
+        hasEnd = ~isAttack | (table != 0)
+        return games, player, isAttack, legal, hasEnd
+
+    def step(self, policies):
+        """
+        Advances every unfinished game by one ply. policies[p] is a vectorized policy
+        (see randomPolicy) deciding for player p; rounds that finish are ended here.
+        """
+        games, player, isAttack, legal, hasEnd = self.getOptions()
+        if len(games) == 0:
+            return
+        choice = np.empty(len(games), dtype=np.int64)
+        for p in (0, 1):
+            mine = player == p
+            if np.any(mine):
+                choice[mine] = policies[p](legal[mine], hasEnd[mine],
+                                           self.trumpSuit[games[mine]], self.rng)
+        self.playCards(games, player, choice)
+        self.endRounds()
+
+    def playCards(self, games, player, cards):
+        ending = cards == END_ROUND
+        self.roundWinner[games[ending]] = 1 - player[ending]
+
+        games, player, cards = games[~ending], player[~ending], cards[~ending]
+        self.hands[games, player] &= ~(np.int64(1) << cards)
+        self.table[games] |= np.int64(1) << cards
+        self.tableSize[games] += 1
+        self.topCard[games] = cards
+
+        emptied = self.hands[games, player] == 0
+        self.roundWinner[games[emptied]] = player[emptied]
+        won = emptied & (self.deckPos[games] == NUM_CARDS)
+        self.winner[games[won]] = player[won]
+
+    def endRounds(self):
+        games = np.flatnonzero((self.roundWinner >= 0) & (self.winner < 0))
+        if len(games) == 0:
+            return
+        attacker = self.attacker[games]
+        defender = 1 - attacker
+        roundWinner = self.roundWinner[games]
+        table = self.table[games]
+
+        attackerWon = attacker == roundWinner
+        self.hands[games, defender] |= np.where(attackerWon, table, 0)
+        self.trash[games] |= np.where(attackerWon, 0, table)
+        self.table[games] = 0
+        self.tableSize[games] = 0
+        self.topCard[games] = END_ROUND
+
+        self.refillHand(games, attacker)
+        self.refillHand(games, defender)
+
+        attacker = np.where(attackerWon, attacker, defender)
+        self.attacker[games] = attacker
+        self.roundWinner[games] = -1
+        finished = (self.hands[games, attacker] == 0) & (self.deckPos[games] == NUM_CARDS)
+        self.winner[games[finished]] = attacker[finished]
+
+    def refillHand(self, games, player):
+        need = np.maximum(HAND_SIZE - _popcount(self.hands[games, player]), 0)
+        count = np.minimum(need, NUM_CARDS - self.deckPos[games])
+        pos = self.deckPos[games]
+        drawn = np.zeros(len(games), dtype=np.int64)
+        for k in range(HAND_SIZE):
+            take = k < count
+            cards = self.deck[games, np.minimum(pos + k, NUM_CARDS - 1)]
+            drawn |= np.where(take, np.int64(1) << cards, 0)
+        self.hands[games, player] |= drawn
+        self.deckPos[games] = pos + count
+
+    def run(self, policies, maxPlies=10000):
+        """
+        Plays every game to the end and returns the winner of each game.
+        """
+        for _ in range(maxPlies):
+            if self.allOver():
+                break
+            self.step(policies)
+        return self.winner.copy()
+
+
+def playGames(agentType, opponentType, numGames, batchSize=10000, seed=None):
+    """
+    Plays numGames games between two built-in policies and returns the win counts
+    of [agent, opponent].
+    """
+    rng = np.random.default_rng(seed)
+    policies = [POLICIES[agentType], POLICIES[opponentType]]
+    winCounts = np.zeros(2, dtype=np.int64)
+    while numGames > 0:
+        batch = BatchDurak(min(batchSize, numGames), seed=rng.integers(2 ** 63))
+        winCounts += np.bincount(batch.run(policies), minlength=2)
+        numGames -= batch.numGames
+    return winCounts
+